@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import unazed_disasm
+
+
+def image_random(size, seed=0x8080):
+    # getrandbits rather than randbytes, which needs python 3.9
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, "little")
+
+
+def image_all_opcodes():
+    data = bytearray()
+    for opcode in unazed_disasm.DECODE_TABLE:
+        data.append(opcode.byte)
+        data += bytes(range(0x01, opcode.length))
+    return bytes(data)
+
+
+def image_three_byte_runs(size):
+    # LXI B / JMP / CALL / LDA with rolling operands
+    ops = (0x01, 0xC3, 0xCD, 0x3A)
+    data = bytearray()
+    while len(data) + 3 <= size:
+        idx = len(data) // 3
+        data += bytes((ops[idx & 3], idx & 0xFF, (idx >> 8) & 0xFF))
+    return bytes(data)
+
+
+# 8080 loops for the emulator, each ends in HLT
+PROGRAMS = {
+    # MVI B,0 / MVI C,0 / DCR C / JNZ 0004H / DCR B / JNZ 0004H / HLT
+    "dcr-jnz": bytes.fromhex("0600 0e00 0d c20400 05 c20400 76"),
+    # LXI H,4000H / MVI C,40H / MVI B,0 / MOV M,B / INX H / DCR B /
+    # JNZ 0007H / DCR C / JNZ 0005H / HLT
+    "fill-16k": bytes.fromhex("210040 0e40 0600 70 23 05 c20700 0d c20500 76"),
+    # LXI H,0 / LXI D,8000H / LXI B,4000H / MOV A,M / STAX D / INX H /
+    # INX D / DCX B / MOV A,B / ORA C / JNZ 0009H / HLT
+    "memcpy-16k": bytes.fromhex(
+        "210000 110080 010040 7e 12 23 13 0b 78 b1 c20900 76"),
+}
+
+
+def images(scale):
+    yield "random-4k", image_random(0x1000)
+    yield "all-opcodes", image_all_opcodes()
+    yield "lxi-jmp-call-runs", image_three_byte_runs(0x10000)
+    yield "random-64k", image_random(0x10000)
+    yield f"concat-{scale}x64k", b"".join(
+        image_random(0x10000, seed) for seed in range(scale))
+    if os.path.exists(path := os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), "example.com")):
+        with open(path, 'rb') as file:
+            yield "example.com", file.read()
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_image(name, data, repeat, memory=True):
+    disasm = unazed_disasm.Disassembler(data, unazed_disasm.OPCODE_MAP,
+                                        org=0x100, on_error="count")
+    batch = disasm.decode_batch()
+
+    def renderer():
+        # a fresh one per run, so the tail cache starts out cold
+        return unazed_disasm.Renderer(disasm.table, disasm.org)
+
+    count = len(batch)
+    modes = {
+        "iterate_records": lambda: sum(1 for _ in disasm.iterate_records()),
+        "decode_batch": lambda: len(disasm.decode_batch()),
+        "iterate_instructions":
+            lambda: sum(1 for _ in disasm.iterate_instructions()),
+        "render_lines": lambda: sum(map(len, map(renderer().line, batch))),
+        # the block path the command line and the emitters go through
+        "render_listing": lambda: sum(map(len, renderer().listing(batch))),
+    }
+    if unazed_disasm.numpy is not None:
+        modes["decode_numpy"] = lambda: len(disasm.decode_numpy())
+    result = {"name": name, "bytes": len(data), "instructions": count,
+              "modes": {}}
+    for mode, fn in modes.items():
+        elapsed, _ = timed(fn, repeat)
+        result["modes"][mode] = {
+            "seconds": elapsed,
+            "instructions_per_second": count / elapsed if elapsed else None,
+            "bytes_per_second": len(data) / elapsed if elapsed else None,
+            "peak_memory_bytes": peak_memory(fn) if memory else None,
+        }
+    return result
+
+
+def bench_program(name, program, repeat):
+    def run(blocks):
+        cpu = unazed_disasm.Cpu(program)
+        return cpu.run_blocks() if blocks else cpu.run()
+
+    def interleaved():
+        # a step() every 4096 instructions, which used to throw all the
+        # translations away
+        cpu = unazed_disasm.Cpu(program)
+        while not cpu.halted:
+            cpu.step()
+            cpu.run_blocks(0x1000)
+        return cpu.steps
+
+    modes = {
+        "run": lambda: run(False),
+        "run_blocks": lambda: run(True),
+        "step_and_run_blocks": interleaved,
+    }
+    result = {"name": name, "bytes": len(program), "modes": {}}
+    for mode, fn in modes.items():
+        elapsed, steps = timed(fn, repeat)
+        result["modes"][mode] = {
+            "seconds": elapsed,
+            "steps": steps,
+            "steps_per_second": steps / elapsed if elapsed else None,
+        }
+    modes = result["modes"]
+    result["speedup"] = modes["run_blocks"]["steps_per_second"] \
+        / modes["run"]["steps_per_second"]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="measure unazed_disasm decode and render throughput")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per measurement, the best is kept")
+    parser.add_argument("--scale", type=int, default=32,
+                        help="number of 64 KiB images in the concatenation")
+    parser.add_argument("--skip-memory", action="store_true",
+                        help="don't measure peak memory (tracemalloc is slow)")
+    parser.add_argument("--output", "-o", default="-",
+                        help="JSON output path, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "numpy": getattr(unazed_disasm.numpy, "__version__", None),
+        "images": [],
+        "programs": [],
+    }
+    for name, data in images(args.scale):
+        print(f"benchmarking {name} ({len(data)} bytes) ...", file=sys.stderr)
+        report["images"].append(bench_image(name, data, args.repeat,
+                                            not args.skip_memory))
+    for name, program in PROGRAMS.items():
+        print(f"benchmarking {name} on the emulator ...", file=sys.stderr)
+        report["programs"].append(bench_program(name, program, args.repeat))
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
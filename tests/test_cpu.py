@@ -0,0 +1,153 @@
+import random
+
+import pytest
+
+import unazed_disasm as u
+
+
+def run(program, blocks=False):
+    cpu = u.Cpu(program)
+    if blocks:
+        cpu.run_blocks(10000)
+    else:
+        cpu.run(10000)
+    assert cpu.halted
+    return cpu
+
+
+@pytest.mark.parametrize("program, a, f", [
+    # MVI A,3AH / MVI B,0C6H / ADD B
+    (b"\x3e\x3a\x06\xc6\x80\x76", 0x00, 0x57),
+    # MVI A,00H / MVI B,01H / SUB B
+    (b"\x3e\x00\x06\x01\x90\x76", 0xFF, 0x87),
+    # MVI A,05H / MVI B,05H / CMP B
+    (b"\x3e\x05\x06\x05\xb8\x76", 0x05, 0x56),
+    # MVI A,0FCH / MVI B,0FH / ANA B
+    (b"\x3e\xfc\x06\x0f\xa0\x76", 0x0C, 0x16),
+    # MVI A,9BH / DAA
+    (b"\x3e\x9b\x27\x76", 0x01, 0x13),
+    # STC / MVI A,0FFH / INR A
+    (b"\x37\x3e\xff\x3c\x76", 0x00, 0x57),
+    # MVI A,00H / DCR A
+    (b"\x3e\x00\x3d\x76", 0xFF, 0x86),
+])
+def test_flags(program, a, f):
+    cpu = run(program)
+    assert (cpu.a, cpu.f) == (a, f)
+
+
+def test_construct_with_memory():
+    cpu = u.Cpu(b"\x3e\x2a\x76")
+    assert cpu.mem[:3] == b"\x3e\x2a\x76"
+    assert cpu.run() == 2
+    assert cpu.halted and cpu.a == 0x2A
+
+
+# MVI B,5 / LXI H,0006H / MVI A,0 / ADD E / MOV E,A / INR M / DCR B /
+# JNZ 0005H / HLT; each pass bumps the MVI immediate it is about to run
+SELF_MODIFYING = bytes.fromhex("0605 210600 3e00 83 5f 34 05 c20500 76")
+
+
+def test_blocks_match_interpreter_on_self_modifying_code():
+    plain = run(SELF_MODIFYING)
+    fast = run(SELF_MODIFYING, blocks=True)
+    assert plain.regs[u.REG_E] == 0 + 1 + 2 + 3 + 4
+    assert fast.regs == plain.regs
+    assert (fast.f, fast.sp, fast.pc) == (plain.f, plain.sp, plain.pc)
+    assert fast.mem == plain.mem
+    assert fast.steps == plain.steps
+    assert fast.cache.invalidations
+
+
+MESSAGE = b"hello$"
+# MVI C,9 / LXI D,msg / CALL 5 / <exit> / MVI C,2 / MVI E,'X' / CALL 5 / HLT
+EXIT_RESET = b"\x0e\x00\xcd\x05\x00"
+EXIT_JMP = b"\xc3\x00\x00\x00\x00"
+
+
+def cpm_program(exit_sequence):
+    tail = b"\xcd\x05\x00" + exit_sequence \
+        + b"\x0e\x02\x1e\x58\xcd\x05\x00\x76"
+    message = u.CPM_TPA + 5 + len(tail)
+    return b"\x0e\x09\x11" + message.to_bytes(2, "little") + tail + MESSAGE
+
+
+@pytest.mark.parametrize("blocks", [False, True], ids=["run", "blocks"])
+@pytest.mark.parametrize("exit_sequence", [EXIT_RESET, EXIT_JMP],
+                         ids=["bdos-0", "jmp-0"])
+def test_cpm_exit(exit_sequence, blocks):
+    cpm = u.Cpm(cpm_program(exit_sequence), blocks=blocks)
+    cpm.run(10000)
+    assert cpm.exited
+    assert cpm.cpu.halted
+    assert bytes(cpm.output) == b"hello"
+
+
+# MVI B,0 / MVI C,0 / DCR C / JNZ 0004H / DCR B / JNZ 0004H / HLT
+NESTED_LOOP = bytes.fromhex("0600 0e00 0d c20400 05 c20400 76")
+
+
+def state(cpu):
+    return cpu.regs, cpu.f, cpu.sp, cpu.pc, cpu.mem, cpu.steps, cpu.halted
+
+
+@pytest.mark.parametrize("budget", [1, 2, 3, 5, 0x100, 0x203, 0x10000])
+def test_blocks_stop_at_the_step_budget(budget):
+    plain = u.Cpu(NESTED_LOOP)
+    fast = u.Cpu(NESTED_LOOP)
+    while not plain.halted:
+        assert fast.run_blocks(budget) == plain.run(budget)
+        assert state(fast) == state(plain)
+
+
+def test_step_keeps_the_translations():
+    cpu = u.Cpu(NESTED_LOOP)
+    cpu.run_blocks(0x1000)
+    misses = cpu.cache.misses
+    while not cpu.halted:
+        cpu.step()
+        cpu.run_blocks(0x1000)
+    # steps land inside blocks at most at the two JNZs and the HLT
+    assert cpu.cache.misses <= misses + 3
+    assert not cpu.cache.invalidations
+    assert cpu.steps == u.Cpu(NESTED_LOOP).run()
+
+
+def test_blocks_see_interpreter_writes():
+    # 0000: MVI A,1 / HLT    0010: MVI A,2 / STA 0001H / HLT
+    cpu = u.Cpu(b"\x3e\x01\x76".ljust(0x10, b"\x00")
+                + b"\x3e\x02\x32\x01\x00\x76")
+    cpu.run_blocks()
+    assert cpu.a == 1
+    cpu.pc = 0x10
+    cpu.run()
+    cpu.pc = 0x00
+    cpu.run_blocks()
+    assert cpu.a == 2
+    assert cpu.cache.invalidations == 1
+
+
+# opcodes that loop, branch, call and store, so random images hit
+# self-modifying code and the stack runs over the program
+FUZZ_OPCODES = (0x00, 0x01, 0x02, 0x05, 0x0D, 0x11, 0x12, 0x21, 0x22, 0x23,
+                0x31, 0x32, 0x34, 0x36, 0x3C, 0x70, 0x77, 0x76, 0xC2, 0xC3,
+                0xC5, 0xC9, 0xCA, 0xCD, 0xE3, 0xE9, 0xF5)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_blocks_match_interpreter_on_random_code(seed):
+    rng = random.Random(seed)
+    program = bytes(rng.choice(FUZZ_OPCODES) for _ in range(0x200))
+    budgets = [rng.randrange(1, 200) for _ in range(20)]
+    plain = u.Cpu(program)
+    fast = u.Cpu(program)
+    for budget in budgets:
+        if budget % 3 == 0:
+            plain.step()
+            fast.step()
+        else:
+            plain.run(budget)
+            fast.run_blocks(budget)
+        assert state(fast) == state(plain)
+        if plain.halted:
+            break
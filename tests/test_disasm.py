@@ -0,0 +1,628 @@
+import io
+import json
+import random
+
+import pytest
+
+import unazed_disasm as u
+
+
+def randbytes(rng, size):
+    return rng.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def disasm(data, on_error="count"):
+    return u.Disassembler(data, u.OPCODE_MAP, on_error=on_error)
+
+
+@pytest.mark.parametrize("on_error", ["count", "db"])
+def test_decode_parallel_matches_decode_batch(on_error):
+    rng = random.Random(0x8080)
+    for _ in range(400):
+        data = randbytes(rng, rng.randrange(10, 80))
+        serial = disasm(data, on_error)
+        parallel = disasm(data, on_error)
+        expected = serial.decode_batch()
+        batch = parallel.decode_parallel(segment_size=7, workers=1)
+        assert list(batch) == list(expected)
+        assert list(map(repr, parallel.errors)) \
+            == list(map(repr, serial.errors))
+
+
+def test_decode_cache_rejects_corrupt_entries(tmp_path):
+    data = randbytes(random.Random(1), 0x400)
+    cache = u.DecodeCache(str(tmp_path))
+    expected = list(cache.decode(disasm(data)))
+    path = cache.path(cache.key(disasm(data)))
+    with open(path, 'r+b') as file:
+        file.write(b"JUNK")
+    with pytest.raises(u.DisassemblerError):
+        u.load_columnar(path)
+    assert list(cache.decode(disasm(data))) == expected
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert list(cache.decode(disasm(data))) == expected
+    assert cache.hits == 1
+
+
+def test_decode_cache_evicts_past_max_bytes(tmp_path):
+    rng = random.Random(2)
+    cache = u.DecodeCache(str(tmp_path), max_bytes=0x4000)
+    for _ in range(20):
+        cache.decode(disasm(randbytes(rng, 0x400)))
+    stats = cache.stats()
+    assert stats["evictions"]
+    assert stats["bytes"] == cache.total <= cache.max_bytes
+
+
+def test_memory_map_common_code_calls_into_banks():
+    # common 0x0000-0x00ff calls 0x4000, which only the two banks map
+    image = bytes.fromhex("cd0040 c30300") + bytes(0x100 - 6) \
+        + bytes.fromhex("c9") * 0x10 + bytes.fromhex("76") * 0x10
+    memory_map = u.MemoryMap([
+        (0x0000, 0x000, 0x100),
+        (0x4000, 0x100, 0x10, 0),
+        (0x4000, 0x110, 0x10, 1),
+    ])
+    (common, batch), *banks = memory_map.decode(image, workers=1)
+    call, jump = list(batch)[:2]
+    assert call.flags & u.FLAG_FAR and not call.flags & u.FLAG_RELOC_OOB
+    assert jump.flags & u.FLAG_RELOC
+    assert memory_map.resolve(0x4000) is None
+    assert memory_map.candidates(0x4000) \
+        == tuple(region for region, _ in banks)
+    assert memory_map.candidates(0x4000, 1) == (banks[1][0],)
+    assert memory_map.candidates(0x8000) == ()
+    refs = memory_map.xrefs([(common, batch)])
+    assert refs[0][4] == memory_map.candidates(0x4000)
+
+
+def test_iterate_classified_one_record_per_string():
+    message = b"Hello, world! " * 20 + b"$"
+    # MVI C,9 / LXI D,0108H / CALL 5 / RST 0 / message
+    code = bytes.fromhex("0e09 110801 cd0500 c7")
+    image = code + message
+    classified = disasm(image)
+    classified.org = 0x100
+    records = list(classified.iterate_classified(
+        [(len(code), len(image), u.SPAN_CPM_STRING)]))
+    strings = [record for record in records if record.flags & u.FLAG_STRING]
+    assert [record.length for record in strings] \
+        == [u.CLASSIFY_MAX_STRING, len(message) - u.CLASSIFY_MAX_STRING]
+    assert b"".join(record.data for record in strings) == message
+    # string records carry their bytes, any renderer will do
+    renderer = u.Renderer(u.DECODE_TABLE, 0x100)
+    for fmt in ("listing", "jsonl", "asm"):
+        for source in (records, u._as_batch(records)):
+            out = io.StringIO()
+            u.write_records(out, source, renderer, fmt)
+            lines = out.getvalue().splitlines()
+            assert sum("world" in line for line in lines) == 2
+            assert "Hello, world! $" in out.getvalue()
+
+
+def test_string_records_survive_patch_and_columnar(tmp_path):
+    image = bytes.fromhex("c30a00") + b"Hello, world$" + b"Bye$" + bytes(4)
+    path = tmp_path / "image.com"
+    path.write_bytes(image)
+    spans = [(3, 16, u.SPAN_CPM_STRING), (16, 20, u.SPAN_CPM_STRING)]
+    with u.Disassembler.from_file(str(path)) as mapped:
+        records = list(mapped.iterate_classified(spans))
+        mapped.patch(3, b"XYZ")
+        string, _ = [record for record in records
+                     if record.flags & u.FLAG_STRING]
+        assert mapped.renderer.mnemonic(string) == "DB 'Hello, world$'"
+    columnar = tmp_path / "image.u8oc"
+    renderer = u.Renderer(u.DECODE_TABLE)
+    with open(columnar, 'wb') as file:
+        u.emit_columnar(file, records, renderer)
+    org, batch = u.load_columnar(str(columnar))
+    assert list(batch) == records
+    assert renderer.mnemonic(batch[1]) == "DB 'Hello, world$'"
+    assert renderer.mnemonic(batch[2]) == "DB 'Bye$'"
+
+
+def test_memory_map_rejects_bad_regions():
+    with pytest.raises(u.DisassemblerError):
+        u.MemoryMap([(0x0000, 0x000, 0x100), (0x0080, 0x100, 0x100, 1)])
+    with pytest.raises(u.DisassemblerError):
+        u.MemoryMap([(0xFF00, 0x000, 0x200)])
+    with pytest.raises(u.DisassemblerError):
+        u.MemoryMap([(0x0000, 0x000, 0x100)]).decode(bytes(0x10), workers=1)
+
+
+@pytest.mark.parametrize("on_error", ["count", "db"])
+@pytest.mark.parametrize("org", [0x0000, 0x0100, 0x8000])
+def test_decode_numpy_matches_decode_batch(on_error, org):
+    pytest.importorskip("numpy")
+    rng = random.Random(org ^ 0x5A)
+    undocumented = [byte for byte, opcode in enumerate(u.DECODE_TABLE)
+                    if opcode.flags & u.FLAG_UNDOCUMENTED]
+    table = dict(u.OPCODE_MAP)
+    # a table with holes exercises the unknown-byte path too
+    for byte in undocumented:
+        del table[chr(byte)]
+    for opcode_map in (u.OPCODE_MAP, table):
+        for size in [0, 1, 2, 3] + [rng.randrange(4, 600) for _ in range(60)]:
+            data = randbytes(rng, size)
+            serial = u.Disassembler(data, opcode_map, org, on_error)
+            vector = u.Disassembler(data, opcode_map, org, on_error)
+            expected = serial.decode_batch()
+            batch = vector.decode_numpy()
+            assert list(batch) == list(expected)
+            assert list(map(repr, vector.errors)) \
+                == list(map(repr, serial.errors))
+
+
+def fresh_state(data, checkpoint):
+    fresh = disasm(bytes(data))
+    index = u.OffsetIndex.build(fresh.data, fresh.table, checkpoint)
+    xrefs = fresh.xrefs()
+    symbols = fresh.symbolize(u.SymbolTable(builtins=False))
+    return index, xrefs, symbols
+
+
+def xref_triples(xrefs):
+    return sorted(zip(xrefs.targets, xrefs.sources, xrefs.kinds))
+
+
+@pytest.mark.parametrize("checkpoint", [0x10, u.INDEX_CHECKPOINT])
+def test_patch_matches_fresh_decode(checkpoint):
+    rng = random.Random(checkpoint)
+    data = bytearray(randbytes(rng, 0x800))
+    patched = disasm(bytes(data))
+    patched.index = u.OffsetIndex.build(patched.data, patched.table,
+                                        checkpoint)
+    patched.xrefs()
+    symbols = patched.symbolize(u.SymbolTable(builtins=False))
+    for _ in range(150):
+        # mostly right around a checkpoint, where a length change moves
+        # instruction starts from one checkpoint slot into the next
+        if rng.random() < 0.7:
+            offset = rng.randrange(0, len(data), checkpoint) \
+                + rng.randrange(-3, 3)
+        else:
+            offset = rng.randrange(len(data))
+        offset = min(max(offset, 0), len(data) - 1)
+        new = randbytes(rng, min(rng.randrange(1, 5), len(data) - offset))
+        if rng.random() < 0.3:
+            # a CALL into the image, so labels come and go
+            target = rng.randrange(len(data))
+            new = bytes((0xCD, target & 0xFF, target >> 8))[:len(new)]
+        data[offset:offset + len(new)] = new
+        records = patched.patch(offset, new)
+
+        index, xrefs, fresh_symbols = fresh_state(data, checkpoint)
+        assert patched.index.starts == index.starts
+        assert patched.index.checkpoints == index.checkpoints
+        assert xref_triples(patched.xref_index) == xref_triples(xrefs)
+        assert symbols.addresses == fresh_symbols.addresses
+        assert symbols.auto == fresh_symbols.auto
+        if records:
+            assert records == list(disasm(bytes(data)).iterate_records(
+                start=records[0].offset, count=len(records)))
+
+
+def test_patch_outside_image():
+    with pytest.raises(u.DisassemblerError):
+        disasm(bytes(4)).patch(3, b"\x00\x00")
+
+
+@pytest.mark.parametrize("on_error", ["count", "db"])
+def test_stream_decoder_splits_anywhere(on_error):
+    rng = random.Random(0x0700)
+    # ends in LXI B with one operand byte, so close() has a tail to report
+    data = randbytes(rng, 0x40) + b"\x01\x02"
+    serial = disasm(data, on_error)
+    expected = list(serial.iterate_records())
+    for split in range(len(data) + 1):
+        decoder = u.StreamDecoder(on_error=on_error)
+        records = decoder.feed(data[:split]) + decoder.feed(data[split:]) \
+            + decoder.close()
+        assert records == expected
+        assert list(map(repr, decoder.errors)) \
+            == list(map(repr, serial.errors))
+    decoder = u.StreamDecoder(on_error=on_error)
+    records = [record for byte in data
+               for record in decoder.feed(bytes((byte,)))] + decoder.close()
+    assert records == expected
+
+
+def test_instruction_at_inside_operands():
+    data = randbytes(random.Random(0x0C), 0x300)
+    indexed = disasm(data)
+    indexed.org = 0x100
+    records = list(indexed.iterate_records())
+    for idx, record in enumerate(records):
+        for offset in range(record.offset, record.offset + record.length):
+            found = indexed.instruction_at(0x100 + offset)
+            assert (found.offset, found.length) \
+                == (record.offset, record.length)
+            assert list(indexed.iterate_records(start=0x100 + offset,
+                                                count=3)) \
+                == records[idx:idx + 3]
+    with pytest.raises(u.DisassemblerError):
+        indexed.instruction_at(0x100 + len(data))
+
+
+def test_index_save_load_round_trip(tmp_path):
+    rng = random.Random(0x0D)
+    data = randbytes(rng, 0x1234)
+    path = str(tmp_path / "image.idx")
+    saved = disasm(data)
+    saved.save_index(path)
+
+    loaded = disasm(data)
+    index = loaded.load_index(path)
+    assert index is loaded.index
+    assert index.starts == saved.index.starts
+    assert index.checkpoints == saved.index.checkpoints
+    assert index.size == len(data)
+
+    with open(path, 'rb') as file:
+        blob = file.read()
+    digest = bytes.fromhex(saved.digest())
+    assert u.OffsetIndex.from_bytes(blob, digest).starts == index.starts
+    assert u.OffsetIndex.from_bytes(blob, bytes(32)) is None
+    assert u.OffsetIndex.from_bytes(b"XXXX" + blob[4:], digest) is None
+
+    # same size, other bytes: the digest doesn't match, so it's rebuilt
+    other = disasm(randbytes(rng, len(data)))
+    rebuilt = other.load_index(path)
+    assert rebuilt.starts == u.OffsetIndex.build(other.data,
+                                                 other.table).starts
+    assert disasm(data).load_index(str(tmp_path / "missing.idx")).starts \
+        == index.starts
+
+
+# org 0x100: JMP 0105H / DB 0FFH,0FFH / CALL 010AH / HLT / DB 0 / RET
+FLOW_PROGRAM = bytes.fromhex("c30501 ffff cd0a01 76 00 c9")
+
+
+def flow_disasm():
+    flow = disasm(FLOW_PROGRAM)
+    flow.org = 0x100
+    return flow
+
+
+def test_traverse_skips_data_between_code():
+    flow = flow_disasm()
+    records = flow.traverse()
+    assert [(record.offset, bool(record.flags & u.FLAG_DATA))
+            for record in records] \
+        == [(0, False), (3, True), (4, True), (5, False), (8, False),
+            (9, True), (10, False)]
+    assert list(flow.code_map) == [
+        u.CODE_START, u.CODE_OPERAND, u.CODE_OPERAND, u.CODE_DATA,
+        u.CODE_DATA, u.CODE_START, u.CODE_OPERAND, u.CODE_OPERAND,
+        u.CODE_START, u.CODE_DATA, u.CODE_START]
+    # the linear sweep takes the data for two RST 7s and a NOP
+    assert not any(record.flags & u.FLAG_DATA
+                   for record in flow.iterate_records())
+    # an entry point of its own reaches the byte after HLT
+    flow.traverse(entries=[0x109], vectors=False)
+    assert [idx for idx, kind in enumerate(flow.code_map)
+            if kind == u.CODE_START] == [9, 10]
+
+
+def test_cfg_blocks_and_edges():
+    cfg = flow_disasm().cfg(cache=False)
+    assert sorted(cfg.blocks) == [0, 5, 8, 10]
+    assert cfg.adjacency() == {
+        0: [(5, u.EDGE_TAKEN)],
+        5: [(10, u.EDGE_CALL), (8, u.EDGE_FALLTHROUGH)],
+        8: [],
+        10: [(None, u.EDGE_RETURN)],
+    }
+    assert cfg.block_at(10).predecessors == [(5, u.EDGE_CALL)]
+    assert cfg.block_at(5).terminator.opcode == 0xCD
+    assert not cfg.external
+
+    # the linear sweep splits at the RST 7s and calls out to 0x38
+    linear = flow_disasm().cfg(linear=True, cache=False)
+    assert linear.external == {0x38}
+    assert flow_disasm().cfg() is flow_disasm().cfg()
+
+
+def test_xref_index():
+    # LDA 0200H / STA 0201H / LXI H,0200H / CALL 0100H / JNZ 0100H / RST 1
+    code = bytes.fromhex("3a0002 320102 210002 cd0001 c20001 cf")
+    linked = disasm(code)
+    linked.org = 0x100
+    xrefs = linked.xrefs()
+    assert len(xrefs) == 6
+    assert xrefs.refs_to(0x200) == [(0, u.XREF_READ), (6, u.XREF_IMMEDIATE)]
+    assert xrefs.refs_to(0x200, u.XREF_READ) == [(0, u.XREF_READ)]
+    assert xrefs.refs_to(0x201) == [(3, u.XREF_WRITE)]
+    assert xrefs.refs_to(0x100) == [(9, u.XREF_CALL), (12, u.XREF_JUMP)]
+    assert xrefs.refs_to(0x08) == [(15, u.XREF_CALL)]
+    assert xrefs.refs_in(0x200, 0x202) == [
+        (0x200, 0, u.XREF_READ), (0x200, 6, u.XREF_IMMEDIATE),
+        (0x201, 3, u.XREF_WRITE)]
+    assert xrefs.targets_of(u.XREF_CALL) == [0x08, 0x100]
+    # traversal only follows the code reached from org
+    assert len(flow_disasm().xrefs(linear=False)) == 2
+
+
+def cli(argv, tmp_path, stdin=None, monkeypatch=None):
+    out = tmp_path / "out.txt"
+    if stdin is not None:
+        monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(stdin)))
+    assert u.main([*argv, "-o", str(out)]) == 0
+    return out.read_text()
+
+
+def expected_listing(data, org):
+    listed = u.Disassembler(data, u.OPCODE_MAP, org, "db")
+    line = listed.renderer.line
+    return "".join(line(record) + "\n" for record in listed.iterate_records())
+
+
+def test_cli_listing_matches_line_renderer(tmp_path, monkeypatch):
+    data = randbytes(random.Random(0x19), 0x3000)
+    path = tmp_path / "image.bin"
+    path.write_bytes(data)
+    assert cli([str(path), "--org", "0x100"], tmp_path) \
+        == expected_listing(data, 0x100)
+    assert cli([str(path), "--start", "0x10", "--length", "0x20"], tmp_path) \
+        == expected_listing(data[0x10:0x30], 0)
+    # stdin streams through StreamDecoder in chunks
+    monkeypatch.setattr(u, "CLI_CHUNK_SIZE", 0x101)
+    assert cli(["-", "--org", "0x100"], tmp_path, data, monkeypatch) \
+        == expected_listing(data, 0x100)
+    assert cli(["--start", "5", "--length", "7"], tmp_path, data,
+               monkeypatch) == expected_listing(data[5:12], 0)
+
+
+def test_cli_jsonl_and_errors(tmp_path, capsys):
+    path = tmp_path / "image.bin"
+    path.write_bytes(bytes.fromhex("3e02 cd0501 01"))
+    objects = [json.loads(line) for line in
+               cli([str(path), "--org", "0x100", "--format", "jsonl",
+                    "--on-error", "db"], tmp_path).splitlines()]
+    assert [obj["text"] for obj in objects] \
+        == ["MVI A,$0x02", "CALL (0x0005)", "DB $0x01"]
+    assert objects[1]["operand"] == 0x105
+    assert u.main([str(path), "--on-error", "raise",
+                   "-o", str(tmp_path / "out.txt")]) == 1
+    assert "Insufficient arguments" in capsys.readouterr().err
+
+
+def assemble(text):
+    # just enough of an 8080 assembler for what emit_asm writes
+    forms = {}
+    for opcode in u.DECODE_TABLE:
+        if not opcode.flags & u.FLAG_UNDOCUMENTED:
+            forms[tuple(opcode.mnemonic.partition(" ")[::2])] = opcode
+    equates = {}
+
+    def number(token, labels):
+        if token in labels:
+            return labels[token]
+        if token in equates:
+            return equates[token]
+        assert token.endswith("H"), token
+        return int(token[:-1], 16)
+
+    labels = {}
+    for final in (False, True):
+        image = bytearray()
+        org = address = None
+        for line in text.splitlines():
+            label, _, rest = line.partition("\t")
+            name, _, args = rest.split("\t;")[0].partition("\t")
+            if name == "EQU":
+                equates[label] = number(args, {})
+                continue
+            if name == "ORG":
+                org = address = number(args, {})
+                continue
+            if name == "END":
+                continue
+            if label:
+                labels[label[:-1]] = address
+            if name == "DB":
+                data = bytes(number(item, {}) for item in args.split(","))
+            elif (name, args) in forms:
+                data = bytes((forms[name, args].byte,))
+            else:
+                head, _, value = args.rpartition(",")
+                prefix = f"{head}," if head else ""
+                opcode, = [opcode for (mnemonic, form), opcode in forms.items()
+                           if mnemonic == name and form == prefix + "%s"]
+                operand = number(value, labels) if final else 0
+                data = bytes((opcode.byte,)) \
+                    + operand.to_bytes(opcode.length - 1, "little")
+            image += data
+            address += len(data)
+    return org, bytes(image)
+
+
+@pytest.mark.parametrize("org", [0x0000, 0x0100])
+def test_emitters_round_trip(org, tmp_path):
+    rng = random.Random(0x20 + org)
+    for size in (0, 1, 5, 0x800):
+        data = randbytes(rng, size)
+        emitted = u.Disassembler(data, u.OPCODE_MAP, org, "db")
+        records = list(emitted.iterate_records())
+        renderer = emitted.renderer
+        for source in (records, emitted.decode_batch()):
+            out = io.StringIO()
+            u.write_records(out, source, renderer, "asm")
+            assert assemble(out.getvalue()) == (org, data)
+
+            out = io.StringIO()
+            assert u.write_records(out, source, renderer, "jsonl") \
+                == len(records)
+            objects = list(map(json.loads, out.getvalue().splitlines()))
+            assert [(obj["offset"], obj["opcode"], obj["operand"],
+                     obj["length"], obj["flags"], obj["text"])
+                    for obj in objects] \
+                == [(record.offset, record.opcode, record.operand,
+                     record.length, record.flags, renderer.mnemonic(record))
+                    for record in records]
+
+            path = tmp_path / "records.u8oc"
+            with open(path, 'wb') as file:
+                assert u.write_records(file, source, renderer, "columnar") \
+                    == len(records)
+            loaded_org, batch = u.load_columnar(str(path))
+            assert loaded_org == org and list(batch) == records
+
+
+def test_asm_labels_and_symbols():
+    # JMP 0105H / undocumented *NOP / HLT at the jump target / CALL BDOS
+    code = bytes.fromhex("c30501 08 00 76 cd0500")
+    emitted = u.Disassembler(code, u.OPCODE_MAP, 0x100)
+    emitted.symbolize()
+    out = io.StringIO()
+    u.write_records(out, emitted.decode_batch(), emitted.renderer, "asm")
+    text = out.getvalue()
+    assert "BDOS\tEQU\t0005H" in text
+    assert "\tJMP\tL0105" in text and "L0105:\tHLT" in text
+    assert "\tDB\t08H\t; NOP" in text
+    assert "\tCALL\tBDOS" in text
+    assert assemble(text) == (0x100, code)
+
+
+def test_symbol_table_load_save(tmp_path):
+    path = tmp_path / "names.sym"
+    path.write_text("; equates and .sym pairs\n"
+                    "START:  EQU 0100H\n"
+                    "COUNT   =   16\n"
+                    "BUF     EQU 0x0200 ; trailing comment\n"
+                    "0300 LOOP 0304 DONE\n"
+                    "\n")
+    symbols = u.SymbolTable(builtins=False)
+    assert symbols.load(str(path)) == 5
+    assert symbols.addresses == {"START": 0x100, "COUNT": 16, "BUF": 0x200,
+                                 "LOOP": 0x300, "DONE": 0x304}
+    assert list(symbols.between(0x100, 0x301)) == [0x100, 0x200, 0x300]
+
+    saved = tmp_path / "saved.sym"
+    symbols.save(str(saved))
+    reloaded = u.SymbolTable(builtins=False)
+    reloaded.load(str(saved))
+    assert reloaded.addresses == symbols.addresses
+
+    # renaming moves the name, adding a taken address is optional
+    assert symbols.add(0x400, "LOOP") and symbols[0x300] is None
+    assert not symbols.add(0x400, "OTHER", replace=False)
+    symbols.remove("LOOP")
+    assert "LOOP" not in symbols and symbols[0x400] is None
+
+    assert u.SymbolTable()[0x0005] == "BDOS"
+    path.write_text("0300 LOOP\nBAD EQU 70000\n")
+    with pytest.raises(u.DisassemblerError, match="names.sym:2"):
+        u.SymbolTable().load(str(path))
+
+
+def test_listing_uses_symbols():
+    # CALL 0005H / JMP 0103H
+    named = u.Disassembler(bytes.fromhex("cd0500 c30301"), u.OPCODE_MAP,
+                           0x100)
+    renderer = named.renderer
+    plain = "".join(renderer.listing(named.decode_batch()))
+    symbols = named.symbolize()
+    assert symbols.auto == {0x103: 1}
+    listing = "".join(renderer.listing(named.decode_batch())).splitlines()
+    assert listing[0] == "TPA:" and listing[2] == "L0103:"
+    assert "CALL (BDOS)" in listing[1] and "JMP (L0103)" in listing[3]
+    assert "(0x0005)" in plain and "(BDOS)" not in plain
+    # the render cache follows changes to the table
+    symbols.add(0x0005, "ENTRY")
+    assert "CALL (ENTRY)" in "".join(renderer.listing(named.decode_batch()))
+
+
+def test_error_policies():
+    table = dict(u.OPCODE_MAP)
+    del table["\x08"]
+    # NOP / hole / LXI B with one operand byte
+    data = bytes.fromhex("00 08 0102")
+
+    def decode(on_error):
+        policy = u.Disassembler(data, table, on_error=on_error)
+        return policy, list(policy.iterate_records())
+
+    counted, records = decode("count")
+    assert [record.offset for record in records] == [0]
+    assert [(error.offset, error.code) for error in counted.errors] \
+        == [(1, u.CODE_MAP['BIN_ILL']), (2, u.CODE_MAP['BIN_ARG'])]
+
+    _, records = decode("db")
+    assert [(record.offset, record.length, record.flags) for record in records] \
+        == [(0, 1, 0), (1, 1, u.FLAG_DATA), (2, 2, u.FLAG_DATA)]
+
+    with pytest.raises(u.DisassemblerError) as info:
+        decode("raise")
+    assert info.value.error.offset == 1
+    # an unknown byte only warns under "halt", a truncated tail exits
+    with pytest.raises(SystemExit):
+        decode("halt")
+    with pytest.raises(u.DisassemblerError):
+        u.Disassembler(data, u.OPCODE_MAP, on_error="bogus")
+
+
+def test_from_file_maps_a_slice(tmp_path):
+    data = randbytes(random.Random(0x06), 0x200)
+    path = tmp_path / "image.bin"
+    path.write_bytes(data)
+    with u.Disassembler.from_file(str(path), offset=0x10, length=0x40,
+                                  on_error="count") as mapped:
+        assert bytes(mapped.data) == data[0x10:0x50]
+        assert list(mapped.iterate_records()) \
+            == list(disasm(data[0x10:0x50]).iterate_records())
+    with u.Disassembler.from_file(str(path), offset=0x1F0,
+                                  length=0x40) as mapped:
+        assert len(mapped.data) == 0x10
+    with pytest.raises(u.DisassemblerError):
+        u.Disassembler.from_file(str(path), offset=0x201)
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    with u.Disassembler.from_file(str(empty)) as mapped:
+        assert list(mapped.iterate_records()) == []
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_disassemble(tmp_path, workers):
+    rng = random.Random(0x17)
+    images = tmp_path / "roms"
+    (images / "sub").mkdir(parents=True)
+    for name in ("a.bin", "sub/b.bin"):
+        (images / name).write_bytes(randbytes(rng, 0x400))
+    out = tmp_path / "out"
+    report = u.batch_disassemble([str(images), str(tmp_path / "missing")],
+                                 str(out), org=0x100, workers=workers)
+    assert (report["files"], report["failed"]) == (3, 1)
+    for name in ("a.bin", "sub/b.bin"):
+        single = u.Disassembler((images / name).read_bytes(), u.OPCODE_MAP,
+                                0x100, "count")
+        assert (out / (name + ".lst")).read_text() \
+            == "".join(single.renderer.listing(single.decode_batch()))
+    with pytest.raises(u.DisassemblerError):
+        u.batch_disassemble([str(images)], str(out), fmt="pdf")
+
+
+def test_classify_strings_and_tables():
+    # LXI D,msg / MVI C,9 / CALL 5 / LXI H,table / RET / NOP / NOP
+    code = bytes.fromhex("110e01 0e09 cd0500 211d01 c9 0000")
+    table = b"".join(address.to_bytes(2, "little")
+                     for address in (0x100, 0x105, 0x108, 0x10B))
+    image = code + b"Hello, world$" + bytes(2) + table
+    classified = u.Disassembler(image, u.OPCODE_MAP, 0x100, "count")
+    spans = [(14, 27, u.SPAN_CPM_STRING), (29, 37, u.SPAN_TABLE)]
+    assert classified.classify() == spans
+    assert u.classify(image, 0x100) == spans
+    # without the LXI H nothing says the words are a table
+    assert u.classify(image.replace(b"\x21\x1d\x01", b"\x00" * 3),
+                      0x100) == spans[:1]
+
+    records = list(classified.iterate_classified())
+    words = [record for record in records if record.flags & u.FLAG_WORD]
+    assert [(record.offset, record.opcode | record.operand << 8)
+            for record in words] \
+        == [(29, 0x100), (31, 0x105), (33, 0x108), (35, 0x10B)]
+    renderer = classified.renderer
+    assert [renderer.mnemonic(record) for record in records
+            if record.flags & u.FLAG_STRING] == ["DB 'Hello, world$'"]
+    assert [record.offset for record in records] \
+        == [0, 3, 5, 8, 11, 12, 13, 14, 27, 28, 29, 31, 33, 35]
@@ -1,9 +1,190 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from itertools import count, islice
+from string import ascii_letters
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
 CODE_MAP = {
     "INT_ERR": 0x01,
     "BIN_ILL": 0x02,
     'BIN_ARG': 0x03
     }
 
+OPERAND_SIZES = {"d8": 0x01, "d16": 0x02, "a16": 0x02}
+
+ASCII_COLUMN = tuple(chr(byte) if chr(byte) in ascii_letters else '.'
+                     for byte in range(0x100))
+
+FLAG_UNDOCUMENTED = 0x01
+FLAG_ADDRESS = 0x02
+FLAG_RELOC = 0x04
+FLAG_RELOC_OOB = 0x08
+FLAG_DATA = 0x10
+FLAG_FAR = 0x20
+FLAG_STRING = 0x40
+FLAG_WORD = 0x80
+
+ERROR_POLICIES = ("halt", "raise", "db", "count")
+
+FLOW_NONE = 0x00
+FLOW_JUMP = 0x01
+FLOW_CJUMP = 0x02
+FLOW_CALL = 0x03
+FLOW_CCALL = 0x04
+FLOW_RST = 0x05
+FLOW_RET = 0x06
+FLOW_CRET = 0x07
+FLOW_PCHL = 0x08
+FLOW_HLT = 0x09
+
+FLOW_TERMINATORS = frozenset((FLOW_JUMP, FLOW_RET, FLOW_PCHL, FLOW_HLT))
+FLOW_CONDITIONS = frozenset(("NZ", "Z", "NC", "C", "PO", "PE", "P", "M"))
+
+EDGE_FALLTHROUGH = "fallthrough"
+EDGE_TAKEN = "taken"
+EDGE_CALL = "call"
+EDGE_RETURN = "return"
+
+CFG_CACHE_SIZE = 0x20
+RENDER_CACHE_SIZE = 0x40000
+LISTING_BLOCK = 0x1000
+
+XREF_JUMP = 0x01
+XREF_CALL = 0x02
+XREF_READ = 0x03
+XREF_WRITE = 0x04
+XREF_IMMEDIATE = 0x05
+
+XREF_NAMES = {XREF_JUMP: "jump", XREF_CALL: "call", XREF_READ: "read",
+              XREF_WRITE: "write", XREF_IMMEDIATE: "immediate"}
+
+INDEX_MAGIC = b"U8OI"
+INDEX_VERSION = 0x01
+INDEX_HEADER = struct.Struct("<4sBxxxIIQ32s")
+INDEX_CHECKPOINT = 0x100
+
+BLOCK_MAX_INSTRS = 0x40
+BLOCK_UNLIMITED = 1 << 62
+
+CPM_TPA = 0x0100
+CPM_BDOS = 0x0005
+CPM_BDOS_TRAP = 0xFE00
+CPM_BOOT_TRAP = 0xFE03
+CPM_BDOS_PORT = 0xFF
+CPM_BOOT_PORT = 0xFE
+
+SEGMENT_SIZE = 0x40000
+
+BATCH_FORMATS = ("listing", "jsonl", "asm", "columnar", "none")
+BATCH_SUFFIXES = {"listing": ".lst", "jsonl": ".jsonl", "asm": ".asm",
+                  "columnar": ".u8c"}
+BINARY_FORMATS = frozenset(("columnar",))
+
+JSONL_TEMPLATE = ('{"offset": %d, "opcode": %d, "operand": %s, "length": %d, '
+                  '"flags": %d, "text": %s}')
+
+COLUMNAR_MAGIC = b"U8OC"
+COLUMNAR_VERSION = 0x02
+COLUMNAR_HEADER = struct.Struct("<4sBxxxIQQ")
+
+# bump whenever decoding would produce different records for the same input
+DECODER_VERSION = 0x01
+DECODE_CACHE_SIZE = 0x40000000
+DECODE_CACHE_SUFFIX = ".u8c"
+# eviction trims to this share of max_bytes, so a full cache is only
+# rescanned every so many stores rather than on each one
+DECODE_CACHE_LOW_WATER = 0.75
+BATCH_CHUNKSIZE = 0x10
+
+CLI_FORMATS = ("listing", "jsonl", "asm", "columnar")
+CLI_BUFFER_SIZE = 0x100000
+CLI_CHUNK_SIZE = 0x10000
+
+CODE_DATA = 0x00
+CODE_START = 0x01
+CODE_OPERAND = 0x02
+
+REGION_KINDS = ("code", "data")
+
+SPAN_STRING = 0x01
+SPAN_CPM_STRING = 0x02
+SPAN_TABLE = 0x03
+
+SPAN_NAMES = {SPAN_STRING: "string", SPAN_CPM_STRING: "cpm-string",
+              SPAN_TABLE: "table"}
+
+CLASSIFY_MIN_STRING = 0x06
+CLASSIFY_MIN_CPM_STRING = 0x03
+CLASSIFY_MIN_TABLE = 0x04
+# longest string record, what the one-byte length column holds
+CLASSIFY_MAX_STRING = 0xFF
+
+# a: letter or digit, s: space, p: other printable, c: CR/LF/TAB, d: '$'
+TEXT_CLASSES = bytes(
+    ord('d') if byte == 0x24 else ord('s') if byte == 0x20
+    else ord('c') if byte in (0x09, 0x0A, 0x0D)
+    else ord('a') if chr(byte).isalnum() and byte < 0x80
+    else ord('p') if 0x20 < byte < 0x7F else ord('.')
+    for byte in range(0x100))
+TEXT_RUN = rb"[aspc]{%d,}d?|[aspc]{%d,%d}d"
+# LXI B / LXI D / LXI H / LHLD and their operand, overlapping
+TABLE_LOADS = re.compile(rb"(?=[\x01\x11\x21\x2A](..))", re.DOTALL)
+
+SYMBOLS_RST = {0x08 * vector: f"RST{vector}" for vector in range(8)}
+SYMBOLS_CPM = {0x0000: "WBOOT", 0x0005: "BDOS", 0x005C: "FCB",
+               0x006C: "FCB2", 0x0080: "TBUFF", 0x0100: "TPA"}
+
+Opcode = namedtuple("Opcode", ["byte", "mnemonic", "length", "kinds",
+                               "flags", "fn", "flow"])
+Region = namedtuple("Region", ["address", "offset", "length", "bank", "kind",
+                               "name"], defaults=(None, "code", None))
+
+
+class DisassemblerError(Exception):
+    def __init__(self, error):
+        super().__init__(f"[{error.code}] {error.msg}: {error.add} "
+                         f"(at +{error.offset:#x})")
+        self.error = error
+
+    def __reduce__(self):
+        return type(self), (self.error,)
+
+
+class DecodeError:
+    __slots__ = ("offset", "code", "msg", "add")
+
+    def __init__(self, offset, code, msg, add):
+        self.offset = offset
+        self.code = code
+        self.msg = msg
+        self.add = add
+
+    def __repr__(self):
+        return f"<DecodeError [{self.code}] +{self.offset:#x}, {self.add!r}>"
+
+
+def _internal_error(add, offset=0):
+    # library code raises rather than int_halt()s, which would take a
+    # long-lived worker down with it
+    return DisassemblerError(DecodeError(offset, CODE_MAP['INT_ERR'],
+                                         "Internal Error", add))
+
 
 class Operand:
     @staticmethod
@@ -49,6 +230,14 @@ class Operand:
     def copy(self):
         return Operand(self.data, self.ty, self.byte_size)
 
+    @classmethod
+    def view(cls, ty, byte_size, data):
+        op = cls.__new__(cls)
+        op.ty = ty
+        op.byte_size = byte_size
+        op.data = data
+        return op
+
 
 class Instruction:
     def __init__(self, op_ident, byte_ident, *operands, fn=None):
@@ -69,59 +258,2964 @@ class Instruction:
         operands = map(Operand.copy, self.operands)
         return Instruction(self.op_ident, self.byte_ident, *operands, fn=self.fn)
 
+    @classmethod
+    def view(cls, opcode, operands=(), note=""):
+        instr = cls.__new__(cls)
+        instr.op_ident = opcode.mnemonic
+        instr.byte_ident = chr(opcode.byte)
+        instr.operands = operands
+        instr.byte_size = opcode.length - 1
+        instr.fn = opcode.fn
+        instr._note = note
+        return instr
+
+    def to_opcode(self):
+        kinds = tuple(op.ty for op in self.operands)
+        flags = FLAG_UNDOCUMENTED if self.op_ident.startswith("*") else 0
+        if "a16" in kinds:
+            flags |= FLAG_ADDRESS
+        return Opcode(ord(self.byte_ident), self.op_ident, self.byte_size + 1,
+                      kinds, flags, self.fn, self.flow())
+
+    def flow(self):
+        name = self.op_ident.lstrip("*").split()[0]
+        has_address = any(op.ty == "a16" for op in self.operands)
+        if name == "JMP":
+            return FLOW_JUMP
+        elif name == "CALL":
+            return FLOW_CALL
+        elif name == "RET":
+            return FLOW_RET
+        elif name == "RST":
+            return FLOW_RST
+        elif name == "PCHL":
+            return FLOW_PCHL
+        elif name == "HLT":
+            return FLOW_HLT
+        elif name[1:] in FLOW_CONDITIONS:
+            if name[0] == "J" and has_address:
+                return FLOW_CJUMP
+            elif name[0] == "C" and has_address:
+                return FLOW_CCALL
+            elif name[0] == "R" and not self.operands:
+                return FLOW_CRET
+        return FLOW_NONE
+
 
-class Disassembler:
-    def __init__(self, data, opcode_map, org=0x00):
+class Record:
+    __slots__ = ("offset", "opcode", "operand", "length", "flags")
+
+    def __init__(self, offset, opcode, operand, length, flags):
+        self.offset = offset
+        self.opcode = opcode
+        self.operand = operand
+        self.length = length
+        self.flags = flags
+
+    def __repr__(self):
+        operand = "" if self.operand is None else f", {self.operand:#x}"
+        return f"<Record +{self.offset:#06x}, {self.opcode:#04x}{operand}>"
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return (self.offset, self.opcode, self.operand, self.length,
+                self.flags) == (other.offset, other.opcode, other.operand,
+                                other.length, other.flags)
+
+
+class StringRecord(Record):
+    # a string is longer than opcode and operand can carry, so it keeps its
+    # bytes; opcode and operand hold the first three of them as usual
+    __slots__ = ("data",)
+
+    def __init__(self, offset, data, flags=FLAG_DATA | FLAG_STRING):
+        super().__init__(offset, data[0], int.from_bytes(data[1:3], "little")
+                         if len(data) > 1 else None, len(data), flags)
         self.data = data
+
+    def __eq__(self, other):
+        if isinstance(other, StringRecord) and self.data != other.data:
+            return False
+        return super().__eq__(other)
+
+
+class RecordBatch:
+    def __init__(self):
+        self.offsets = array("I")
+        self.opcodes = array("B")
+        self.operands = array("H")
+        self.lengths = array("B")
+        self.flags = array("B")
+        # offset -> bytes of every string record
+        self.strings = {}
+
+    @classmethod
+    def from_columns(cls, offsets, opcodes, operands, lengths, flags,
+                     strings=None):
+        batch = cls.__new__(cls)
+        batch.offsets = offsets
+        batch.opcodes = opcodes
+        batch.operands = operands
+        batch.lengths = lengths
+        batch.flags = flags
+        batch.strings = {} if strings is None else strings
+        return batch
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        length = int(self.lengths[idx])
+        if self.strings and int(self.flags[idx]) & FLAG_STRING:
+            offset = int(self.offsets[idx])
+            return StringRecord(offset, self.strings[offset],
+                                int(self.flags[idx]))
+        return Record(int(self.offsets[idx]), int(self.opcodes[idx]),
+                      int(self.operands[idx]) if length > 1 else None,
+                      length, int(self.flags[idx]))
+
+    def __iter__(self):
+        # array, numpy and memoryview columns all hand back plain ints
+        for lo in range(0, len(self), LISTING_BLOCK):
+            for offset, opcode, operand, length, flags in zip(*(
+                    col[lo:lo + LISTING_BLOCK].tolist()
+                    for col in self.columns)):
+                if flags & FLAG_STRING and self.strings:
+                    yield StringRecord(offset, self.strings[offset], flags)
+                    continue
+                yield Record(offset, opcode, operand if length > 1 else None,
+                             length, flags)
+
+    def append(self, record):
+        self.offsets.append(record.offset)
+        self.opcodes.append(record.opcode)
+        self.operands.append(record.operand or 0)
+        self.lengths.append(record.length)
+        self.flags.append(record.flags)
+        if record.flags & FLAG_STRING:
+            self.strings[record.offset] = record.data
+
+    @property
+    def columns(self):
+        return (self.offsets, self.opcodes, self.operands, self.lengths,
+                self.flags)
+
+    @property
+    def nbytes(self):
+        return sum(col.itemsize * len(col) for col in
+                   (self.offsets, self.opcodes, self.operands, self.lengths,
+                    self.flags)) + sum(map(len, self.strings.values()))
+
+
+class Renderer:
+    def __init__(self, table, org=0x00, symbols=None):
+        self.table = table
+        self.org = org
+        self.symbols = symbols
+        self._tails = {}
+        self._templates = {}
+        self._version = None
+
+    def _sync_symbols(self):
+        # rendered tails embed symbol names, so they go stale with the table
+        version = None if self.symbols is None else self.symbols.version
+        if version != self._version:
+            self._tails.clear()
+            self._version = version
+
+    @staticmethod
+    def raw_bytes(record):
+        if record.flags & FLAG_STRING:
+            return record.data
+        if record.operand is None:
+            return (record.opcode,)
+        return (record.opcode,
+                *record.operand.to_bytes(record.length - 1, "little"))
+
+    def value(self, record):
+        if record.flags & FLAG_RELOC:
+            return record.operand - self.org
+        return record.operand
+
+    def operand(self, record):
+        if record.operand is None:
+            return None
+        ty = self.table[record.opcode].kinds[0]
+        data = format(self.value(record), 'x').rjust(2 * OPERAND_SIZES[ty], '0')
+        return f"(0x{data})" if ty == "a16" else f"$0x{data}"
+
+    def mnemonic(self, record):
+        if record.flags & FLAG_WORD:
+            value = record.opcode | record.operand << 8
+            if self.symbols is not None and (name := self.symbols[value]):
+                return f"DW ({name})"
+            return f"DW (0x{value:04x})"
+        if record.flags & FLAG_STRING:
+            return "DB " + _text_items(self.raw_bytes(record), "'{}'".format,
+                                       "$0x{:02x}".format)
+        if record.flags & FLAG_DATA:
+            return "DB " + ','.join(map("$0x{:02x}".format,
+                                        self.raw_bytes(record)))
+        template = self.table[record.opcode].mnemonic
+        if record.operand is None:
+            return template
+        if self.symbols is not None and record.flags & FLAG_ADDRESS \
+                and (name := self.symbols.names[record.operand]):
+            return template % f"({name})"
+        return template % self.operand(record)
+
+    def note(self, record):
+        flags = record.flags
+        note = ""
+        if flags & FLAG_WORD:
+            return "(table) "
+        if flags & FLAG_STRING:
+            return "(string) "
+        if flags & FLAG_DATA:
+            return "(data) "
+        if flags & FLAG_RELOC:
+            note = f"(reloc. -{hex(self.org)}) "
+        elif flags & FLAG_RELOC_OOB:
+            note = f"(reloc. out of bounds) "
+        elif flags & FLAG_FAR:
+            note = f"(other region) "
+        if flags & FLAG_UNDOCUMENTED:
+            note += "(unused op.) "
+        return note
+
+    def instruction(self, record):
+        if record.flags & FLAG_DATA:
+            opcode = Opcode(record.opcode, "DB %s", record.length, (),
+                            FLAG_DATA, None, FLOW_NONE)
+            return (Instruction.view(opcode, (), self.note(record)),
+                    self.mnemonic(record)[3:])
+        opcode = self.table[record.opcode]
+        note = self.note(record)
+        if record.operand is None:
+            return (Instruction.view(opcode, (), note),)
+        ty = opcode.kinds[0]
+        operand = self.operand(record)
+        data = operand[3:7] if ty == "a16" else operand[3:]
+        op = Operand.view(ty, OPERAND_SIZES[ty],
+                          data if not len(data) % 2 else f"\x00{data}")
+        return (Instruction.view(opcode, (op,), note), operand)
+
+    def _tail(self, record):
+        opcode = record.opcode
+        if record.flags & FLAG_DATA:
+            chars = self.raw_bytes(record)
+            hexbytes = ' '.join(map("{:02x}".format, chars[:6]))
+            if len(chars) > 6:
+                # the whole string is in the mnemonic column anyway
+                hexbytes = hexbytes[:14] + " .."
+                chars = chars[:4]
+        elif record.operand is None:
+            chars = (opcode,)
+            hexbytes = f"{opcode:02x}  "
+        else:
+            chars = (opcode, *self.value(record).to_bytes(record.length - 1,
+                                                          "big"))
+            hexbytes = f"{opcode:02x}  " + ' '.join(map("{:02x}".format,
+                                                        chars[1:]))
+        ascii_ = ''.join(map(ASCII_COLUMN.__getitem__, chars)).ljust(3, '.')
+        return (f"{hexbytes:20s} {self.mnemonic(record):20s} {ascii_:4s} "
+                f"{self.note(record)}")
+
+    def _template(self, opcode, length, flags):
+        # _tail() as a %-template over the operand's displayed value
+        op = self.table[opcode]
+        if flags & FLAG_DATA or length not in (2, 3) \
+                or OPERAND_SIZES.get(op.kinds[0]) != length - 1:
+            return None
+        digits = 2 * (length - 1)
+        shown = f"(0x%0{digits}x)" if op.kinds[0] == "a16" \
+            else f"$0x%0{digits}x"
+        mnemonic = op.mnemonic % shown
+        width = len(mnemonic) - len("%04x") + digits
+        hexbytes = f"{opcode:02x}  %02x" if length == 2 \
+            else f"{opcode:02x}  %02x %02x"
+        note = self.note(Record(0, opcode, None, length, flags))
+        return (hexbytes + " " * (21 - (4 + 3 * (length - 1) - 1))
+                + mnemonic + " " * (max(20 - width, 0) + 1)
+                + ASCII_COLUMN[opcode] + "%s" * (length - 1)
+                + "." * (3 - length) + "  " + note.replace("%", "%%"))
+
+    def _cached_tail(self, offset, opcode, operand, length, flags):
+        key = opcode | operand << 8 | length << 24 | flags << 32
+        if (tail := self._tails.get(key)) is not None:
+            return tail
+        if len(self._tails) >= RENDER_CACHE_SIZE:
+            self._tails.clear()
+        tkey = (opcode, length, flags)
+        if (template := self._templates.get(tkey, 0)) == 0:
+            template = self._templates[tkey] = self._template(
+                opcode, length, flags)
+        if template is None or flags & FLAG_ADDRESS \
+                and self.symbols is not None and self.symbols.names[operand]:
+            tail = self._tail(Record(offset, opcode,
+                                     operand if length > 1 else None, length,
+                                     flags))
+        else:
+            value = operand - self.org if flags & FLAG_RELOC else operand
+            if length == 2:
+                tail = template % (value, value, ASCII_COLUMN[value])
+            else:
+                hi, lo = value >> 8, value & 0xFF
+                tail = template % (hi, lo, value, ASCII_COLUMN[hi],
+                                   ASCII_COLUMN[lo])
+        self._tails[key] = tail
+        return tail
+
+    def line(self, record):
+        self._sync_symbols()
+        if record.flags & FLAG_STRING:
+            # keyed on opcode and operand, the cache can't tell strings apart
+            return f"+{record.offset:04x}".ljust(12) + self._tail(record)
+        return f"+{record.offset:04x}".ljust(12) + self._cached_tail(
+            record.offset, record.opcode, record.operand or 0, record.length,
+            record.flags)
+
+    def listing(self, records, block=LISTING_BLOCK):
+        # everything right of the offset column depends only on the
+        # opcode, operand, length and flags, so it's rendered once per key
+        # and each block of lines is put together with a single template
+        if not isinstance(records, RecordBatch):
+            records = iter(records)
+            while chunk := list(islice(records, block)):
+                lines = [self.line(record) + "\n" for record in chunk]
+                if self.symbols is not None:
+                    self._labels(lines, [record.offset for record in chunk])
+                yield "".join(lines)
+            return
+        self._sync_symbols()
+        get = self._tails.get
+        miss = self._cached_tail
+        columns = records.columns
+        keys = None
+        if numpy is not None and isinstance(columns[1], numpy.ndarray):
+            keys = columns[1].astype(numpy.uint64)
+            for col, shift in zip(columns[2:], (8, 24, 32)):
+                keys |= col.astype(numpy.uint64) << numpy.uint64(shift)
+        for lo in range(0, len(records), block):
+            # array and numpy columns alike come back as plain int lists
+            offsets, opcodes, operands, lengths, flags = (
+                col[lo:lo + block].tolist() for col in columns)
+            digits = max(len(f"{offsets[-1]:x}"), 4)
+            template = None
+            if max(len(f"{offsets[0]:x}"), 4) == digits <= 10:
+                template = f"+%0{digits}x{' ' * (11 - digits)}%s\n"
+            if keys is None:
+                tails = list(map(get, [
+                    opcode | operand << 8 | length << 24 | flag << 32
+                    for opcode, operand, length, flag in zip(
+                        opcodes, operands, lengths, flags)]))
+            else:
+                tails = list(map(get, keys[lo:lo + block].tolist()))
+            for idx in [idx for idx, tail in enumerate(tails) if tail is None]:
+                if flags[idx] & FLAG_STRING:
+                    tails[idx] = self._tail(records[lo + idx])
+                    continue
+                tails[idx] = miss(offsets[idx], opcodes[idx], operands[idx],
+                                  lengths[idx], flags[idx])
+            if template is None:
+                lines = [f"+{offset:04x}".ljust(12) + tail + "\n"
+                         for offset, tail in zip(offsets, tails)]
+            else:
+                lines = list(map(template.__mod__, zip(offsets, tails)))
+            if self.symbols is not None:
+                self._labels(lines, offsets)
+            yield "".join(lines)
+
+    def _labels(self, lines, offsets):
+        # a "NAME:" line ahead of every named instruction start
+        org = self.org
+        names = self.symbols.names
+        found = []
+        for address in self.symbols.between(org + offsets[0],
+                                            org + offsets[-1] + 1):
+            idx = bisect_left(offsets, address - org)
+            if offsets[idx] == address - org:
+                found.append((idx, f"{names[address]}:\n"))
+        for idx, label in reversed(found):
+            lines.insert(idx, label)
+
+
+class BasicBlock:
+    __slots__ = ("start", "end", "records", "successors", "predecessors")
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.records = []
+        self.successors = []
+        self.predecessors = []
+
+    def __repr__(self):
+        return (f"<BasicBlock +{self.start:#06x}..+{self.end:#06x}, "
+                f"{len(self.records)} instrs>")
+
+    @property
+    def terminator(self):
+        return self.records[-1]
+
+
+class ControlFlowGraph:
+    def __init__(self, org=0x00):
+        self.org = org
+        self.blocks = {}
+        self.edges = []
+        self.external = set()
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks.values())
+
+    def block_at(self, offset):
+        return self.blocks.get(offset)
+
+    def adjacency(self):
+        return {start: [(dst, kind) for dst, kind in block.successors]
+                for start, block in self.blocks.items()}
+
+    @classmethod
+    def build(cls, records, table, org=0x00):
+        records = [record for record in records
+                   if not record.flags & FLAG_DATA]
+        starts = set(record.offset for record in records)
+        leaders = set()
+        if records:
+            leaders.add(records[0].offset)
+        for record in records:
+            flow = table[record.opcode].flow
+            if flow == FLOW_NONE:
+                continue
+            leaders.add(record.offset + record.length)
+            if flow in (FLOW_JUMP, FLOW_CJUMP, FLOW_CALL, FLOW_CCALL):
+                leaders.add(record.operand - org)
+            elif flow == FLOW_RST:
+                leaders.add((record.opcode & 0x38) - org)
+
+        cfg = cls(org)
+        blocks = cfg.blocks
+        block = None
+        for record in records:
+            offset = record.offset
+            if block is None or offset in leaders or offset != block.end:
+                block = blocks[offset] = BasicBlock(offset)
+            block.records.append(record)
+            block.end = offset + record.length
+
+        for block in blocks.values():
+            last = block.terminator
+            flow = table[last.opcode].flow
+            edges = []
+            if flow in (FLOW_JUMP, FLOW_CJUMP):
+                edges.append((last.operand - org, EDGE_TAKEN))
+            elif flow in (FLOW_CALL, FLOW_CCALL):
+                edges.append((last.operand - org, EDGE_CALL))
+            elif flow == FLOW_RST:
+                edges.append(((last.opcode & 0x38) - org, EDGE_CALL))
+            elif flow in (FLOW_RET, FLOW_CRET):
+                edges.append((None, EDGE_RETURN))
+            if flow not in FLOW_TERMINATORS and block.end in starts:
+                edges.append((block.end, EDGE_FALLTHROUGH))
+            for dst, kind in edges:
+                if dst is not None and dst not in blocks:
+                    cfg.external.add(dst + org)
+                    continue
+                block.successors.append((dst, kind))
+                cfg.edges.append((block.start, dst, kind))
+                if dst is not None:
+                    blocks[dst].predecessors.append((block.start, kind))
+        return cfg
+
+
+_CFG_CACHE = OrderedDict()
+
+
+def xref_kind(opcode):
+    if opcode is None:
+        return 0
+    name = opcode.mnemonic.lstrip("*").split()[0]
+    if opcode.flow in (FLOW_JUMP, FLOW_CJUMP):
+        return XREF_JUMP
+    elif opcode.flow in (FLOW_CALL, FLOW_CCALL, FLOW_RST):
+        return XREF_CALL
+    elif name in ("LDA", "LHLD"):
+        return XREF_READ
+    elif name in ("STA", "SHLD"):
+        return XREF_WRITE
+    elif name == "LXI":
+        return XREF_IMMEDIATE
+    return 0
+
+
+class XrefIndex:
+    def __init__(self, targets, sources, kinds):
+        self.targets = targets
+        self.sources = sources
+        self.kinds = kinds
+
+    def __len__(self):
+        return len(self.targets)
+
+    @classmethod
+    def build(cls, records, table):
+        kinds_t = tuple(map(xref_kind, table))
+        targets = array("H")
+        sources = array("I")
+        kinds = array("B")
+        for record in records:
+            if not (kind := kinds_t[record.opcode]) or record.flags & FLAG_DATA:
+                continue
+            if table[record.opcode].flow == FLOW_RST:
+                targets.append(record.opcode & 0x38)
+            else:
+                targets.append(record.operand)
+            sources.append(record.offset)
+            kinds.append(kind)
+        order = sorted(range(len(targets)), key=targets.__getitem__)
+        return cls(array("H", map(targets.__getitem__, order)),
+                   array("I", map(sources.__getitem__, order)),
+                   array("B", map(kinds.__getitem__, order)))
+
+    def replace(self, start, end, records, table):
+        # drop every reference made from [start, end) and add those of
+        # the re-decoded records there, keeping the arrays sorted by target
+        keep = [idx for idx, source in enumerate(self.sources)
+                if not start <= source < end]
+        fresh = XrefIndex.build(records, table)
+        targets = array("H", map(self.targets.__getitem__, keep))
+        sources = array("I", map(self.sources.__getitem__, keep))
+        kinds = array("B", map(self.kinds.__getitem__, keep))
+        for target, source, kind in zip(fresh.targets, fresh.sources,
+                                        fresh.kinds):
+            idx = bisect_right(targets, target)
+            targets.insert(idx, target)
+            sources.insert(idx, source)
+            kinds.insert(idx, kind)
+        self.targets, self.sources, self.kinds = targets, sources, kinds
+
+    def refs_to(self, address, kind=None):
+        lo = bisect_left(self.targets, address)
+        hi = bisect_right(self.targets, address, lo)
+        return [(self.sources[idx], self.kinds[idx]) for idx in range(lo, hi)
+                if kind is None or self.kinds[idx] == kind]
+
+    def refs_in(self, start, end):
+        lo = bisect_left(self.targets, start)
+        hi = bisect_left(self.targets, end, lo)
+        return [(self.targets[idx], self.sources[idx], self.kinds[idx])
+                for idx in range(lo, hi)]
+
+    def targets_of(self, kind):
+        return sorted(set(target for target, k in zip(self.targets, self.kinds)
+                          if k == kind))
+
+
+class OffsetIndex:
+    def __init__(self, starts, size, checkpoint=INDEX_CHECKPOINT):
+        self.starts = starts
+        self.size = size
+        self.checkpoint = checkpoint
+        self.checkpoints = array("I", (
+            bisect_left(starts, offset)
+            for offset in range(0, size + checkpoint, checkpoint)))
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def build(cls, buf, table, checkpoint=INDEX_CHECKPOINT):
+        lengths = bytes(opcode.length if opcode else 1 for opcode in table)
+        size = len(buf)
+        starts = array("I")
+        append = starts.append
+        pos = 0
+        while pos < size:
+            append(pos)
+            pos += lengths[buf[pos]]
+        return cls(starts, size, checkpoint)
+
+    def lookup(self, offset):
+        if not 0 <= offset < self.size:
+            raise _internal_error(f"offset {offset:#x} lies outside the "
+                                  f"indexed image ({self.size:#x} bytes)",
+                                  offset)
+        slot = offset // self.checkpoint
+        lo = self.checkpoints[slot]
+        hi = min(self.checkpoints[slot + 1] + 1, len(self.starts))
+        return bisect_right(self.starts, offset, lo, hi) - 1
+
+    def start_of(self, offset):
+        return self.starts[self.lookup(offset)]
+
+    def splice(self, lo, hi, starts):
+        # checkpoints at or before the first replaced start keep their count
+        first = self.starts[lo] if lo < len(self.starts) else self.size
+        self.starts[lo:hi] = array("I", starts)
+        for slot in range(first // self.checkpoint, len(self.checkpoints)):
+            self.checkpoints[slot] = bisect_left(self.starts,
+                                                 slot * self.checkpoint)
+
+    def to_bytes(self, digest=b""):
+        starts = self.starts
+        if sys.byteorder != "little":
+            starts = array("I", starts)
+            starts.byteswap()
+        return INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.checkpoint,
+                                 len(starts), self.size, digest) \
+            + starts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, digest=None):
+        magic, version, checkpoint, count, size, stored = \
+            INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            return None
+        if digest is not None and stored != digest.ljust(32, b"\x00"):
+            return None
+        starts = array("I")
+        starts.frombytes(data[INDEX_HEADER.size:
+                              INDEX_HEADER.size + count * starts.itemsize])
+        if sys.byteorder != "little":
+            starts.byteswap()
+        return cls(starts, size, checkpoint)
+
+
+def _parse_address(text, base=16):
+    text = text.strip().rstrip(":")
+    lower = text.lower()
+    if lower.startswith("0x"):
+        value = int(text[2:], 16)
+    elif text.startswith(("$", "#")):
+        value = int(text[1:], 16)
+    elif lower.endswith("h"):
+        value = int(text[:-1], 16)
+    else:
+        value = int(text, base)
+    if not 0 <= value <= 0xFFFF:
+        raise ValueError(f"address {text!r} is outside the 8080 address space")
+    return value
+
+
+class SymbolTable:
+    def __init__(self, builtins=True):
+        self.names = [None] * 0x10000
+        self.addresses = {}
+        # address -> number of jumps/calls to it, for the names auto_label
+        # made up, so they can go again once nothing refers to them
+        self.auto = {}
+        self.version = 0
+        self._sorted = None
+        if builtins:
+            for symbols in (SYMBOLS_RST, SYMBOLS_CPM):
+                for address, name in symbols.items():
+                    self.add(address, name)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __contains__(self, name):
+        return name in self.addresses
+
+    def __getitem__(self, address):
+        return self.names[address]
+
+    def get(self, name):
+        return self.addresses.get(name)
+
+    def add(self, address, name, replace=True):
+        if not 0 <= address <= 0xFFFF:
+            raise _internal_error(f"symbol {name!r} at {address:#x} is "
+                                  f"outside the 8080 address space")
+        if (old := self.names[address]) is not None:
+            if not replace:
+                return False
+            del self.addresses[old]
+        if (moved := self.addresses.get(name)) is not None:
+            self.names[moved] = None
+            self.auto.pop(moved, None)
+        self.auto.pop(address, None)
+        self.names[address] = name
+        self.addresses[name] = address
+        self.version += 1
+        self._sorted = None
+        return True
+
+    def remove(self, name):
+        if (address := self.addresses.pop(name, None)) is not None:
+            self.names[address] = None
+            self.auto.pop(address, None)
+            self.version += 1
+            self._sorted = None
+
+    def between(self, start, end):
+        if self._sorted is None:
+            self._sorted = array("H", sorted(self.addresses.values()))
+        return self._sorted[bisect_left(self._sorted, start):
+                            bisect_left(self._sorted, end)]
+
+    def load(self, path):
+        added = 0
+        with open(path) as file:
+            for lineno, line in enumerate(file, 1):
+                fields = line.split(";")[0].split()
+                try:
+                    if len(fields) == 3 and fields[1].upper() in ("EQU",
+                                                                 "="):
+                        # NAME EQU addr, bare numbers are decimal there
+                        self.add(_parse_address(fields[2], 10),
+                                 fields[0].rstrip(":"))
+                        added += 1
+                        continue
+                    # .sym: one or more "addr NAME" pairs per line
+                    if len(fields) % 2:
+                        raise ValueError("expected address/name pairs")
+                    for idx in range(0, len(fields), 2):
+                        self.add(_parse_address(fields[idx]),
+                                 fields[idx + 1])
+                        added += 1
+                except (ValueError, DisassemblerError) as exc:
+                    reason = exc.error.add \
+                        if isinstance(exc, DisassemblerError) else exc
+                    raise _internal_error(
+                        f"{path}:{lineno}: can't read symbol line "
+                        f"{line.strip()!r} ({reason})") from exc
+        return added
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            for address in self.between(0, 0x10000):
+                file.write(f"{self.names[address]}\tEQU\t"
+                           f"{_asm_number(address, 4)}\n")
+
+    @staticmethod
+    def _jump_targets(records, table, org, size):
+        for record in records:
+            if record.flags & FLAG_DATA or table[record.opcode].flow not in (
+                    FLOW_JUMP, FLOW_CJUMP, FLOW_CALL, FLOW_CCALL):
+                continue
+            target = record.operand
+            if size is not None and not org <= target < org + size:
+                continue
+            yield target
+
+    def auto_label(self, records, table, org=0x00, size=None, prefix="L"):
+        added = 0
+        auto = self.auto
+        for target in self._jump_targets(records, table, org, size):
+            if self.add(target, f"{prefix}{target:04X}", replace=False):
+                added += 1
+                auto[target] = 1
+            elif target in auto:
+                auto[target] += 1
+        return added
+
+    def auto_unlabel(self, records, table, org=0x00, size=None):
+        removed = 0
+        auto = self.auto
+        for target in self._jump_targets(records, table, org, size):
+            if target not in auto:
+                continue
+            auto[target] -= 1
+            if not auto[target]:
+                self.remove(self.names[target])
+                removed += 1
+        return removed
+
+
+def _text_items(chars, quoted, byte):
+    # printable runs go in quotes, anything else (and the quote) as bytes
+    items = []
+    run = ""
+    for char in chars:
+        if 0x20 <= char < 0x7F and char != 0x27:
+            run += chr(char)
+            continue
+        if run:
+            items.append(quoted(run))
+            run = ""
+        items.append(byte(char))
+    if run:
+        items.append(quoted(run))
+    return ','.join(items)
+
+
+def classify(data, org=0x00, code_map=None, min_string=CLASSIFY_MIN_STRING,
+             min_table=CLASSIFY_MIN_TABLE):
+    buf = bytes(data)
+    size = len(buf)
+    spans = []
+
+    # text: one translate() into byte classes, then one regex pass
+    classes = buf.translate(TEXT_CLASSES)
+    text_run = re.compile(TEXT_RUN % (
+        min_string, CLASSIFY_MIN_CPM_STRING - 1,
+        max(min_string, CLASSIFY_MIN_CPM_STRING) - 1))
+    for match in text_run.finditer(classes):
+        start, end = match.span()
+        run = match.group()
+        letters = run.count(b"a")
+        if run.endswith(b"d"):
+            if end - start >= CLASSIFY_MIN_CPM_STRING and letters:
+                spans.append((start, end, SPAN_CPM_STRING))
+        elif end - start >= min_string and 2 * letters >= end - start \
+                and (b"s" in run or b"c" in run
+                     or end - start >= 2 * min_string):
+            spans.append((start, end, SPAN_STRING))
+
+    # address tables: runs of little-endian words pointing into the image
+    # (at traversed instruction starts, when a code map is given) that
+    # begin at an address the code loads with LXI or LHLD
+    if size:
+        first, last = org >> 8, min(org + size - 1, 0xFFFF) >> 8
+        in_image = bytes(0x01 if first <= page <= last else 0x00
+                         for page in range(0x100))
+        starts = sorted(set(
+            int.from_bytes(match.group(1), "little") - org
+            for match in TABLE_LOADS.finditer(buf)))
+        end = 0
+        for pos in starts:
+            if pos < end or not 0 <= pos < size:
+                continue
+            end = pos
+            while end + 1 < size and in_image[buf[end + 1]]:
+                target = buf[end] | buf[end + 1] << 8
+                if not org <= target < org + size or (
+                        code_map is not None
+                        and code_map[target - org] != CODE_START):
+                    break
+                end += 2
+            if (end - pos) // 2 >= min_table:
+                spans.append((pos, end, SPAN_TABLE))
+            else:
+                end = pos
+
+    # keep the earliest (then longest) of overlapping spans, and never
+    # claim bytes a traversal proved to be code
+    spans.sort(key=lambda span: (span[0], span[0] - span[1]))
+    kept = []
+    end = 0
+    for span in spans:
+        if span[0] < end:
+            continue
+        if code_map is not None \
+                and code_map.count(CODE_DATA, span[0], span[1]) \
+                != span[1] - span[0]:
+            continue
+        kept.append(span)
+        end = span[1]
+    return kept
+
+
+def compile_opcode_map(opcode_map):
+    table = [None] * 0x100
+    for byte_ident, instr in opcode_map.items():
+        table[ord(byte_ident)] = instr.to_opcode()
+    return tuple(table)
+
+
+class _Decoder:
+    def __init__(self, opcode_map, org, on_error):
+        if on_error not in ERROR_POLICIES:
+            raise _internal_error(f"unexpected error policy {on_error!r}, "
+                                  f"expected one of {ERROR_POLICIES}")
         self.org = org
         self.opcode_map = opcode_map
+        if opcode_map is OPCODE_MAP:
+            self.table = DECODE_TABLE
+        else:
+            self.table = compile_opcode_map(opcode_map)
+        self.renderer = Renderer(self.table, org)
+        self.on_error = on_error
+        self.errors = []
+
+    def _error(self, code, offset, msg, add, fatal):
+        error = DecodeError(offset, code, msg, add)
+        self.errors.append(error)
+        if self.on_error == "raise":
+            raise DisassemblerError(error)
+        if self.on_error == "halt":
+            int_halt(code, msg, add, not fatal)
+
+    def _unknown(self, byte, offset):
+        self._error(CODE_MAP['BIN_ILL'], offset, "Diassembler Error",
+                    f"Unknown byte {byte!r} parsed", False)
+
+    def _truncated(self, opcode, offset):
+        self._error(CODE_MAP['BIN_ARG'], offset, "Disassembler Error",
+                    f"Insufficient arguments for {opcode.mnemonic!r}"
+                    f" expected 1 `{opcode.kinds[-1]}` arg, got none", True)
+
+    @staticmethod
+    def _data_record(offset, tail):
+        operand = int.from_bytes(tail[1:], "little") if len(tail) > 1 else None
+        return Record(offset, tail[0], operand, len(tail), FLAG_DATA)
+
+
+class Disassembler(_Decoder):
+    def __init__(self, data, opcode_map, org=0x00, on_error="halt"):
+        super().__init__(opcode_map, org, on_error)
+        self.data = data
+        self._np_tables = None
+        self._mmap = None
+        self.code_map = None
+        self.xref_index = None
+        self.xref_linear = None
+        self.auto_symbols = None
+        self.index = None
+        self.seams = []
+
+    @classmethod
+    def from_file(cls, path, opcode_map=None, org=0x00, offset=0, length=None,
+                  on_error="halt"):
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if offset < 0 or offset > size:
+                raise _internal_error(f"Disassembler.from_file offset "
+                                      f"{offset:#x} lies outside {path!r} "
+                                      f"({size:#x} bytes)", offset)
+            end = size if length is None else min(size, offset + length)
+            if not size:
+                return cls(b"", opcode_map or OPCODE_MAP, org, on_error)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        disasm = cls(memoryview(mapped)[offset:end], opcode_map or OPCODE_MAP,
+                     org, on_error)
+        disasm._mmap = mapped
+        return disasm
+
+    def close(self):
+        if self._mmap is None:
+            return
+        if isinstance(self.data, memoryview):
+            self.data.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _buffer(self):
+        buf = self.data
+        if not isinstance(buf, (bytes, bytearray, memoryview)):
+            buf = bytes(buf)
+        return buf
+
+    def iterate_records(self, start=None, count=None):
+        self.errors.clear()
+        pos = 0
+        if start is not None:
+            pos = self.build_index().start_of(start - self.org)
+        if count is None:
+            return self._sweep(pos)
+        return islice(self._sweep(pos), count)
+
+    def _sweep(self, pos):
+        buf = self._buffer()
+        size = len(buf)
+        table = self.table
+        org = self.org
+        while pos < size:
+            byte = buf[pos]
+            if (opcode := table[byte]) is None:
+                self._unknown(byte, pos)
+                if self.on_error == "db":
+                    yield Record(pos, byte, None, 1, FLAG_DATA)
+                pos += 1
+                continue
+            length = opcode.length
+            if length == 1:
+                yield Record(pos, byte, None, 1, opcode.flags)
+                pos += 1
+                continue
+            if pos + length > size:
+                self._truncated(opcode, pos)
+                if self.on_error == "db":
+                    yield self._data_record(pos, bytes(buf[pos:]))
+                return
+            if length == 2:
+                operand = buf[pos + 1]
+            elif length == 3:
+                operand = buf[pos + 1] | (buf[pos + 2] << 8)
+            else:
+                operand = int.from_bytes(buf[pos + 1:pos + length], "little")
+            flags = opcode.flags
+            if flags & FLAG_ADDRESS:
+                flags |= FLAG_RELOC if operand >= org else FLAG_RELOC_OOB
+            yield Record(pos, byte, operand, length, flags)
+            pos += length
+
+    def build_index(self, rebuild=False):
+        if self.index is None or rebuild:
+            self.index = OffsetIndex.build(self._buffer(), self.table)
+        return self.index
+
+    def save_index(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.build_index().to_bytes(
+                bytes.fromhex(self.digest())))
+
+    def load_index(self, path):
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return self.build_index()
+        index = OffsetIndex.from_bytes(data, bytes.fromhex(self.digest()))
+        if index is None or index.size != len(self._buffer()):
+            return self.build_index(rebuild=True)
+        self.index = index
+        return index
+
+    def instruction_at(self, address):
+        return next(self.iterate_records(start=address, count=1), None)
+
+    def decode_batch(self):
+        batch = RecordBatch()
+        append = batch.append
+        for record in self.iterate_records():
+            append(record)
+        return batch
+
+    def decode_parallel(self, segment_size=SEGMENT_SIZE, workers=None):
+        buf = self._buffer()
+        size = len(buf)
+        if self.table is not DECODE_TABLE or size <= segment_size:
+            self.seams = []
+            return self.decode_batch()
+        self.errors.clear()
+        jobs = []
+        for start in range(0, size, segment_size):
+            end = min(start + segment_size, size)
+            # two bytes of overlap so an instruction starting in the
+            # segment can always be completed
+            jobs.append((bytes(buf[start:end + 2]), start, end - start,
+                         self.org))
+        if workers == 1:
+            segments = list(map(_decode_segment, jobs))
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                segments = list(pool.map(_decode_segment, jobs))
+
+        batch = RecordBatch()
+        self.seams = seams = []
+        pos = 0
+        for seg_start, seg_end, columns in segments:
+            if pos < seg_start:
+                # only an instruction truncated by the end of the image
+                # can leave a gap; the final sweep below reports it
+                break
+            offsets = columns[0]
+            skip = bisect_left(offsets, pos)
+            redecoded = 0
+            if skip == len(offsets) or offsets[skip] != pos:
+                # speculative decode is misaligned; sweep from the true
+                # boundary until it lands on one of the segment's starts
+                for record in self._sweep(pos):
+                    if record.offset >= seg_end:
+                        break
+                    batch.append(record)
+                    redecoded += 1
+                    pos = record.offset + record.length
+                    skip = bisect_left(offsets, pos, skip)
+                    if skip < len(offsets) and offsets[skip] == pos:
+                        break
+                else:
+                    # ran off the end of the image, truncation included
+                    pos = size
+            if seg_start:
+                seams.append({"offset": seg_start, "discarded": skip,
+                              "redecoded": redecoded})
+            if skip < len(offsets) and offsets[skip] == pos:
+                for col, part in zip(batch.columns, columns):
+                    col.extend(part[skip:])
+                pos = offsets[-1] + batch.lengths[-1]
+        if pos < size:
+            for record in self._sweep(pos):
+                batch.append(record)
+        return batch
+
+    def _numpy_tables(self):
+        if self._np_tables is None:
+            if any(opcode and opcode.length > 3 for opcode in self.table):
+                raise _internal_error("Disassembler.decode_numpy only "
+                                      "supports opcodes of up to 3 bytes")
+            self._np_tables = (
+                numpy.array([opcode.length if opcode else 1
+                             for opcode in self.table], dtype=numpy.uint8),
+                numpy.array([opcode.flags if opcode else 0
+                             for opcode in self.table], dtype=numpy.uint8),
+                numpy.array([opcode is None for opcode in self.table]))
+        return self._np_tables
+
+    def decode_numpy(self):
+        if numpy is None:
+            raise _internal_error("Disassembler.decode_numpy requires numpy")
+        lengths_t, flags_t, unknown_t = self._numpy_tables()
+        self.errors.clear()
+        buf = numpy.frombuffer(self._buffer(), dtype=numpy.uint8)
+        size = len(buf)
+        # jump[i] is the start of the instruction following one at i, with
+        # `size` as an absorbing sentinel; the sweep path from 0 is found by
+        # pointer doubling: after round k `on` holds the first 2**k starts
+        jump = numpy.empty(size + 1, dtype=numpy.int64)
+        numpy.add(numpy.arange(size), lengths_t[buf], out=jump[:size])
+        numpy.minimum(jump[:size], size, out=jump[:size])
+        jump[size] = size
+        on = numpy.zeros(size + 1, dtype=bool)
+        on[0] = True
+        while True:
+            starts = numpy.flatnonzero(on)
+            targets = jump[starts]
+            if on[targets].all():
+                break
+            on[targets] = True
+            jump = jump[jump]
+        starts = numpy.flatnonzero(on[:size])
+        opcodes = buf[starts]
+        unknown = unknown_t[opcodes]
+        if unknown.any():
+            for pos in starts[unknown]:
+                self._unknown(int(buf[pos]), int(pos))
+            if self.on_error != "db":
+                starts = starts[~unknown]
+                opcodes = buf[starts]
+                unknown = unknown[~unknown]
+        lengths = lengths_t[opcodes]
+        tail = None
+        if len(starts) and starts[-1] + lengths[-1] > size:
+            self._truncated(self.table[opcodes[-1]], int(starts[-1]))
+            if self.on_error == "db":
+                tail = self._data_record(int(starts[-1]),
+                                         bytes(buf[starts[-1]:]))
+            starts, opcodes, lengths = starts[:-1], opcodes[:-1], lengths[:-1]
+            unknown = unknown[:-1]
+        padded = numpy.concatenate((buf, numpy.zeros(2, dtype=numpy.uint8)))
+        lo = padded[starts + 1].astype(numpy.uint16)
+        hi = padded[starts + 2].astype(numpy.uint16)
+        operands = numpy.where(lengths == 3, lo | (hi << 8),
+                               numpy.where(lengths == 2, lo, 0))
+        operands = operands.astype(numpy.uint16)
+        flags = flags_t[opcodes]
+        address = (flags & FLAG_ADDRESS).astype(bool)
+        flags = flags | numpy.where(
+            address, numpy.where(operands >= self.org, FLAG_RELOC,
+                                 FLAG_RELOC_OOB), 0).astype(numpy.uint8)
+        flags[unknown] = FLAG_DATA
+        if tail is not None:
+            starts = numpy.append(starts, tail.offset)
+            opcodes = numpy.append(opcodes, numpy.uint8(tail.opcode))
+            operands = numpy.append(operands, numpy.uint16(tail.operand or 0))
+            lengths = numpy.append(lengths, numpy.uint8(tail.length))
+            flags = numpy.append(flags, numpy.uint8(FLAG_DATA))
+        offset_ty = numpy.uint32 if size < 1 << 32 else numpy.uint64
+        return RecordBatch.from_columns(starts.astype(offset_ty), opcodes,
+                                        operands, lengths, flags)
+
+    def traverse(self, entries=None, vectors=True):
+        self.errors.clear()
+        buf = self._buffer()
+        size = len(buf)
+        table = self.table
+        org = self.org
+        code_map = bytearray(size)
+        found = [None] * size
+        work = [org] if entries is None else list(entries)
+        if vectors:
+            work.extend(range(0x00, 0x40, 0x08))
+        work = [addr - org for addr in work]
+        while work:
+            pos = work.pop()
+            while 0 <= pos < size and code_map[pos] != CODE_START:
+                byte = buf[pos]
+                if (opcode := table[byte]) is None:
+                    self._unknown(byte, pos)
+                    break
+                length = opcode.length
+                if pos + length > size:
+                    self._truncated(opcode, pos)
+                    break
+                operand = None
+                flags = opcode.flags
+                if length == 2:
+                    operand = buf[pos + 1]
+                elif length == 3:
+                    operand = buf[pos + 1] | (buf[pos + 2] << 8)
+                elif length > 3:
+                    operand = int.from_bytes(buf[pos + 1:pos + length],
+                                             "little")
+                if flags & FLAG_ADDRESS:
+                    flags |= FLAG_RELOC if operand >= org else FLAG_RELOC_OOB
+                found[pos] = Record(pos, byte, operand, length, flags)
+                code_map[pos] = CODE_START
+                for idx in range(pos + 1, pos + length):
+                    if not code_map[idx]:
+                        code_map[idx] = CODE_OPERAND
+                flow = opcode.flow
+                if flow in (FLOW_JUMP, FLOW_CJUMP, FLOW_CALL, FLOW_CCALL):
+                    work.append(operand - org)
+                elif flow == FLOW_RST:
+                    work.append((byte & 0x38) - org)
+                if flow in FLOW_TERMINATORS:
+                    break
+                pos += length
+        self.code_map = code_map
+        records = []
+        for pos in range(size):
+            if (record := found[pos]) is not None:
+                records.append(record)
+            elif not code_map[pos]:
+                records.append(Record(pos, buf[pos], None, 1, FLAG_DATA))
+        return records
+
+    def digest(self):
+        return hashlib.sha256(self._buffer()).hexdigest()
+
+    def cfg(self, linear=False, cache=True):
+        key = (self.digest(), self.org, linear, self.table is DECODE_TABLE)
+        if cache and (cfg := _CFG_CACHE.get(key)) is not None:
+            _CFG_CACHE.move_to_end(key)
+            return cfg
+        records = self.decode_batch() if linear else self.traverse()
+        cfg = ControlFlowGraph.build(records, self.table, self.org)
+        if cache and self.table is DECODE_TABLE:
+            _CFG_CACHE[key] = cfg
+            if len(_CFG_CACHE) > CFG_CACHE_SIZE:
+                _CFG_CACHE.popitem(last=False)
+        return cfg
+
+    def xrefs(self, linear=True):
+        records = self.iterate_records() if linear else self.traverse()
+        self.xref_index = XrefIndex.build(records, self.table)
+        self.xref_linear = linear
+        return self.xref_index
+
+    def symbolize(self, symbols=None, auto=True):
+        if symbols is None:
+            symbols = SymbolTable()
+        if auto:
+            symbols.auto_label(self.iterate_records(), self.table, self.org,
+                               len(self._buffer()))
+        self.renderer.symbols = symbols
+        self.auto_symbols = symbols if auto else None
+        return symbols
+
+    def classify(self, traverse=True, min_string=CLASSIFY_MIN_STRING,
+                 min_table=CLASSIFY_MIN_TABLE):
+        code_map = None
+        if traverse:
+            self.traverse()
+            code_map = self.code_map
+        return classify(self._buffer(), self.org, code_map, min_string,
+                        min_table)
+
+    def iterate_classified(self, spans=None):
+        if spans is None:
+            spans = self.classify()
+        buf = self._buffer()
+        self.errors.clear()
+        pos = 0
+        for start, end, kind in [*spans, (len(buf), len(buf), None)]:
+            if pos < start:
+                for record in self._sweep(pos):
+                    if record.offset + record.length > start:
+                        # an instruction running into the span is cut short
+                        if record.offset < start:
+                            yield self._data_record(
+                                record.offset, bytes(buf[record.offset:start]))
+                        break
+                    yield record
+            if kind == SPAN_TABLE:
+                for pos in range(start, end, 2):
+                    yield Record(pos, buf[pos], buf[pos + 1], 2,
+                                 FLAG_DATA | FLAG_WORD)
+            elif kind is not None:
+                for pos in range(start, end, CLASSIFY_MAX_STRING):
+                    yield StringRecord(pos, bytes(
+                        buf[pos:min(pos + CLASSIFY_MAX_STRING, end)]))
+            pos = end
+
+    def patch(self, offset, new_bytes):
+        size = len(self.data)
+        if offset < 0 or offset + len(new_bytes) > size:
+            raise _internal_error(f"patch of {len(new_bytes)} bytes at "
+                                  f"{offset:#x} runs outside the image "
+                                  f"({size:#x} bytes)", offset)
+        index = self.build_index()
+        if not isinstance(self.data, bytearray):
+            data = bytearray(self.data)
+            self.close()
+            self.data = data
+        buf = self.data
+        end = offset + len(new_bytes)
+        replaced = bytes(buf[offset:end])
+        buf[offset:end] = new_bytes
+
+        # instructions before the one holding `offset` keep their bytes;
+        # re-walk from it until a start lines up with the old decode again
+        old = index.starts
+        lo = index.lookup(offset) if size else 0
+        pos = old[lo] if size else 0
+        lengths = bytes(opcode.length if opcode else 1
+                        for opcode in self.table)
+        starts = []
+        while pos < size:
+            if pos >= end:
+                hi = bisect_left(old, pos, lo)
+                if hi < len(old) and old[hi] == pos:
+                    break
+            starts.append(pos)
+            pos += lengths[buf[pos]]
+        else:
+            hi = len(old)
+        first = starts[0] if starts else pos
+        stop = old[hi] if hi < len(old) else size
+        index.splice(lo, hi, starts)
+
+        records = list(islice(self._sweep(first), len(starts)))
+        if (symbols := self.auto_symbols) is not None:
+            # auto labels follow the jumps; the replaced instructions are
+            # decoded again from the bytes as they were
+            before = bytearray(buf[first:stop])
+            before[offset - first:end - first] = replaced
+            symbols.auto_unlabel(
+                Disassembler(bytes(before), self.opcode_map,
+                             on_error="count").iterate_records(),
+                self.table, self.org, size)
+            symbols.auto_label(records, self.table, self.org, size)
+        if self.xref_index is not None:
+            if self.xref_linear:
+                self.xref_index.replace(first, pos, records, self.table)
+            else:
+                self.xref_index = None
+        # reachability can change with any patched branch
+        self.code_map = None
+        self.seams = []
+        return records
+
+    def to_instruction(self, record):
+        return self.renderer.instruction(record)
+
+    def iterate_instructions(self, start=None, count=None):
+        instruction = self.renderer.instruction
+        for record in self.iterate_records(start, count):
+            yield instruction(record)
+
+
+class StreamDecoder(_Decoder):
+    def __init__(self, opcode_map=None, org=0x00, on_error="halt"):
+        super().__init__(opcode_map or OPCODE_MAP, org, on_error)
+        self.offset = 0
+        self.pending = b""
+
+    def feed(self, chunk):
+        buf = self.pending + bytes(chunk) if self.pending else chunk
+        size = len(buf)
+        table = self.table
+        org = self.org
+        base = self.offset
+        records = []
+        append = records.append
+        pos = 0
+        while pos < size:
+            byte = buf[pos]
+            if (opcode := table[byte]) is None:
+                self._unknown(byte, base + pos)
+                if self.on_error == "db":
+                    append(Record(base + pos, byte, None, 1, FLAG_DATA))
+                pos += 1
+                continue
+            length = opcode.length
+            if length == 1:
+                append(Record(base + pos, byte, None, 1, opcode.flags))
+                pos += 1
+                continue
+            if pos + length > size:
+                break
+            if length == 2:
+                operand = buf[pos + 1]
+            elif length == 3:
+                operand = buf[pos + 1] | (buf[pos + 2] << 8)
+            else:
+                operand = int.from_bytes(buf[pos + 1:pos + length], "little")
+            flags = opcode.flags
+            if flags & FLAG_ADDRESS:
+                flags |= FLAG_RELOC if operand >= org else FLAG_RELOC_OOB
+            append(Record(base + pos, byte, operand, length, flags))
+            pos += length
+        self.pending = bytes(buf[pos:])
+        self.offset = base + pos
+        return records
+
+    def close(self):
+        pending = self.pending
+        if not pending:
+            return []
+        self.pending = b""
+        self.offset += len(pending)
+        self._truncated(self.table[pending[0]], self.offset - len(pending))
+        if self.on_error == "db":
+            return [self._data_record(self.offset - len(pending), pending)]
+        return []
+
+    def iterate_file(self, file, chunk_size=0x10000, length=None):
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None \
+                else min(chunk_size, remaining)
+            if not (chunk := file.read(size)):
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield from self.feed(chunk)
+        yield from self.close()
+
+
+class MemoryMap:
+    def __init__(self, regions):
+        regions = [Region(**region) if isinstance(region, dict)
+                   else Region(*region) for region in regions]
+        for region in regions:
+            if region.kind not in REGION_KINDS \
+                    or not 0 <= region.address < region.address \
+                    + region.length <= 0x10000 or region.offset < 0:
+                raise _internal_error(f"bad memory map region {region}")
+        # a bank of None is always mapped; banked regions only overlap
+        # regions of other banks
+        for idx, region in enumerate(regions):
+            for other in regions[idx + 1:]:
+                if (region.bank is None or other.bank is None
+                        or region.bank == other.bank) \
+                        and region.address < other.address + other.length \
+                        and other.address < region.address + region.length:
+                    raise _internal_error(f"memory map regions {region} "
+                                          f"and {other} overlap")
+        self.regions = sorted(regions, key=lambda region: (
+            region.address, -1 if region.bank is None else region.bank))
+        self.errors = []
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __iter__(self):
+        return iter(self.regions)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path) as file:
+            return cls(json.load(file))
+
+    def resolve(self, address, bank=None):
+        common = None
+        for region in self.regions:
+            if region.address <= address < region.address + region.length:
+                if region.bank == bank:
+                    return region
+                if region.bank is None:
+                    common = region
+        return common
+
+    def candidates(self, address, bank=None):
+        # code can't know which bank is switched in, so an address that only
+        # other banks map could land in any of them
+        if (region := self.resolve(address, bank)) is not None:
+            return (region,)
+        return tuple(region for region in self.regions
+                     if region.address <= address
+                     < region.address + region.length)
+
+    def file_offset(self, address, bank=None):
+        if (region := self.resolve(address, bank)) is None:
+            return None
+        return region.offset + address - region.address
+
+    def decode(self, source, opcode_map=None, on_error="halt", workers=None):
+        # `source` is a path, which every worker maps for itself, or a
+        # bytes-like image the regions are sliced out of without copying
+        opcode_map = opcode_map or OPCODE_MAP
+        jobs = [(source, region, on_error) for region in self.regions]
+        if workers == 1 or opcode_map is not OPCODE_MAP:
+            results = [_decode_region(job, opcode_map) for job in jobs]
+        else:
+            if not isinstance(source, str):
+                buf = memoryview(source)
+                jobs = [(bytes(buf[region.offset:region.offset
+                                   + region.length]), region._replace(
+                                       offset=0), on_error)
+                        for region in self.regions]
+            with ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(_decode_region, jobs))
+        self.errors = []
+        decoded = []
+        for region, (columns, errors) in zip(self.regions, results):
+            batch = RecordBatch.from_columns(*columns)
+            self._resolve_flags(region, batch)
+            self.errors.extend((region, error) for error in errors)
+            decoded.append((region, batch))
+        return decoded
+
+    def _resolve_flags(self, region, batch):
+        flags = batch.flags
+        operands = batch.operands
+        for idx, flag in enumerate(flags):
+            if not flag & FLAG_ADDRESS or flag & FLAG_DATA:
+                continue
+            flag &= ~(FLAG_RELOC | FLAG_RELOC_OOB | FLAG_FAR)
+            targets = self.candidates(operands[idx], region.bank)
+            if not targets:
+                flag |= FLAG_RELOC_OOB
+            elif targets == (region,):
+                flag |= FLAG_RELOC
+            else:
+                flag |= FLAG_FAR
+            flags[idx] = flag
+
+    def xrefs(self, decoded, table=None):
+        table = table or DECODE_TABLE
+        refs = []
+        for region, batch in decoded:
+            for record in batch:
+                if record.flags & FLAG_ADDRESS \
+                        and not record.flags & FLAG_DATA:
+                    refs.append((region, record.offset, record.operand,
+                                 xref_kind(table[record.opcode]),
+                                 self.candidates(record.operand,
+                                                 region.bank)))
+        return refs
+
+
+F_S = 0x80
+F_Z = 0x40
+F_AC = 0x10
+F_P = 0x04
+F_ONE = 0x02
+F_CY = 0x01
+
+REG_B, REG_C, REG_D, REG_E, REG_H, REG_L, REG_M, REG_A = range(8)
+
+# S, Z and P flags (plus the always-set bit 1) for every 8-bit result
+SZP = bytes((byte & F_S) | (F_Z if not byte else 0) | F_ONE
+            | (F_P if not bin(byte).count("1") & 1 else 0)
+            for byte in range(0x100))
+
+# mask, expected value of the flags for NZ, Z, NC, C, PO, PE, P, M
+CONDITIONS = ((F_Z, 0), (F_Z, F_Z), (F_CY, 0), (F_CY, F_CY),
+              (F_P, 0), (F_P, F_P), (F_S, 0), (F_S, F_S))
+
+
+class Cpu:
+    __slots__ = ("regs", "f", "sp", "pc", "mem", "halted", "inte", "steps",
+                 "handlers", "lengths", "io_in", "io_out", "table", "cache")
+
+    def __init__(self, memory=None, table=None):
+        table = table or DECODE_TABLE
+        self.regs = [0] * 8
+        self.f = F_ONE
+        self.sp = 0x0000
+        self.pc = 0x0000
+        self.mem = bytearray(0x10000)
+        self.table = table
+        self.cache = None
+        if memory is not None:
+            self.load(memory)
+        self.halted = False
+        self.inte = 0
+        self.steps = 0
+        self.handlers = tuple(opcode.fn if opcode else _op_illegal
+                              for opcode in table)
+        self.lengths = bytes(opcode.length if opcode else 1
+                             for opcode in table)
+        self.io_in = lambda port: 0x00
+        self.io_out = lambda port, value: None
+
+    def load(self, data, address=0x0000):
+        self.mem[address:address + len(data)] = data
+        self.touch()
+
+    def touch(self):
+        # memory changed behind the block cache's back, every block is
+        # checked against it again before it next runs
+        if self.cache is not None:
+            self.cache.generation += 1
+
+    def __repr__(self):
+        regs = self.regs
+        return (f"<Cpu pc={self.pc:04x} sp={self.sp:04x} a={regs[REG_A]:02x} "
+                f"f={self.f:02x} bc={regs[REG_B]:02x}{regs[REG_C]:02x} "
+                f"de={regs[REG_D]:02x}{regs[REG_E]:02x} "
+                f"hl={regs[REG_H]:02x}{regs[REG_L]:02x}>")
+
+    @property
+    def a(self):
+        return self.regs[REG_A]
+
+    @property
+    def bc(self):
+        return (self.regs[REG_B] << 8) | self.regs[REG_C]
+
+    @property
+    def de(self):
+        return (self.regs[REG_D] << 8) | self.regs[REG_E]
+
+    @property
+    def hl(self):
+        return (self.regs[REG_H] << 8) | self.regs[REG_L]
 
-    def iterate_instructions(self):
-        byte_stack = list(self.data)
-        while byte_stack:
-            byte = byte_stack.pop(0)
-            if (instr := self.opcode_map.get(chr(byte), None)) is None:
-                int_halt(CODE_MAP['BIN_ILL'], "Diassembler Error",
-                         f"Unknown byte {byte!r} parsed", True)
+    def step(self):
+        return self.run(1)
+
+    def run(self, max_steps=None):
+        mem = self.mem
+        handlers = self.handlers
+        lengths = self.lengths
+        steps = 0
+        self.halted = False
+        # the interpreter has no write probes
+        self.touch()
+        try:
+            for steps in (count(1) if max_steps is None
+                          else range(1, max_steps + 1)):
+                pc = self.pc
+                op = mem[pc]
+                length = lengths[op]
+                if length == 1:
+                    self.pc = (pc + 1) & 0xFFFF
+                    handlers[op](self)
+                elif length == 2:
+                    self.pc = (pc + 2) & 0xFFFF
+                    handlers[op](self, mem[(pc + 1) & 0xFFFF])
+                else:
+                    self.pc = (pc + 3) & 0xFFFF
+                    handlers[op](self, mem[(pc + 1) & 0xFFFF]
+                                 | (mem[(pc + 2) & 0xFFFF] << 8))
+        except CpuHalt:
+            self.halted = True
+        self.steps += steps
+        return steps
+
+    def run_blocks(self, max_steps=None):
+        if self.cache is None:
+            self.cache = BlockCache()
+        cache = self.cache
+        blocks = cache.blocks
+        code = cache.code
+        mem = self.mem
+        steps = 0
+        limit = -1 if max_steps is None else max_steps
+        self.halted = False
+        block = None
+        try:
+            while steps != limit:
+                if (block := blocks.get(self.pc)) is None \
+                        or block.generation != cache.generation \
+                        and not cache.revalidate(block, mem):
+                    block = cache.translate(self, self.pc)
+                else:
+                    cache.hits += 1
+                if not 0 < limit - steps < len(block.entries):
+                    steps += block.run(self, limit - steps if limit > 0
+                                       else BLOCK_UNLIMITED)
+                    continue
+                # the tail of a step budget runs one entry at a time
+                for fn, operand, next_pc, probe in \
+                        block.entries[:limit - steps]:
+                    self.pc = next_pc
+                    if operand is None:
+                        fn(self)
+                    else:
+                        fn(self, operand)
+                    if probe is not None:
+                        addr = probe(self, operand)
+                        if code[addr] or code[(addr + 1) & 0xFFFF]:
+                            cache.invalidate(addr)
+                            if not block.alive:
+                                break
+                steps += block.executed(self.pc)
+        except CpuHalt:
+            # handlers that can stop the cpu all see their own pc
+            steps += block.executed(self.pc)
+            self.halted = True
+        self.steps += steps
+        return steps
+
+
+class CpuHalt(Exception):
+    pass
+
+
+class Cpm:
+    def __init__(self, program, stdin=None, stdout=None, blocks=True):
+        self.cpu = cpu = Cpu()
+        mem = cpu.mem
+        # JMP BOOT at 0x0000, JMP BDOS at 0x0005; the traps are an OUT to a
+        # reserved port followed by RET (BDOS) or HLT (warm boot)
+        mem[0x0000:0x0003] = bytes((0xC3,)) + CPM_BOOT_TRAP.to_bytes(2, "little")
+        mem[CPM_BDOS:CPM_BDOS + 3] = bytes((0xC3,)) \
+            + CPM_BDOS_TRAP.to_bytes(2, "little")
+        mem[CPM_BDOS_TRAP:CPM_BDOS_TRAP + 2] = bytes((0xD3, CPM_BDOS_PORT))
+        mem[CPM_BDOS_TRAP + 2] = 0xC9
+        mem[CPM_BOOT_TRAP:CPM_BOOT_TRAP + 2] = bytes((0xD3, CPM_BOOT_PORT))
+        mem[CPM_BOOT_TRAP + 2] = 0x76
+        cpu.load(program, CPM_TPA)
+        cpu.pc = CPM_TPA
+        cpu.sp = CPM_BDOS_TRAP - 2
+        cpu.io_out = self._out
+        self.stdin = stdin
+        self.stdout = stdout
+        self.output = bytearray()
+        self.blocks = blocks
+        self.exited = False
+        self.bdos_calls = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, 'rb') as file:
+            return cls(file.read(), **kwargs)
+
+    def run(self, max_steps=None):
+        cpu = self.cpu
+        if self.blocks:
+            return cpu.run_blocks(max_steps)
+        return cpu.run(max_steps)
+
+    def _out(self, port, value):
+        pc = (self.cpu.pc - 2) & 0xFFFF
+        if port == CPM_BDOS_PORT and pc == CPM_BDOS_TRAP:
+            self.bdos()
+        elif port == CPM_BOOT_PORT and pc == CPM_BOOT_TRAP:
+            self.exited = True
+
+    def _write(self, data):
+        self.output += data
+        if self.stdout is not None:
+            self.stdout.write(data)
+
+    def _read(self):
+        if self.stdin is None:
+            return b""
+        return self.stdin.read(1)
+
+    def bdos(self):
+        cpu = self.cpu
+        regs = cpu.regs
+        mem = cpu.mem
+        func = regs[REG_C]
+        self.bdos_calls += 1
+        result = 0x00
+        if func == 0x00:
+            # stop right here; the rest of the cached trap block would RET
+            self.exited = True
+            raise CpuHalt
+        elif func == 0x01:
+            char = self._read()
+            result = char[0] if char else 0x1A
+            if char:
+                self._write(char)
+        elif func == 0x02:
+            self._write(bytes((regs[REG_E],)))
+        elif func == 0x09:
+            addr = cpu.de
+            end = mem.find(b"$", addr)
+            if end < 0:
+                end = len(mem)
+            self._write(bytes(mem[addr:end]))
+        elif func == 0x0A:
+            addr = cpu.de
+            limit = mem[addr]
+            line = bytearray()
+            while len(line) < limit and (char := self._read()) \
+                    and char not in b"\r\n":
+                line += char
+            mem[addr + 1] = len(line)
+            mem[addr + 2:addr + 2 + len(line)] = line
+            cpu.touch()
+        elif func == 0x0B:
+            if self.stdin is not None and hasattr(self.stdin, "peek"):
+                result = 0xFF if self.stdin.peek(1)[:1] else 0x00
+            elif self.stdin is not None and hasattr(self.stdin, "getbuffer"):
+                pending = self.stdin.tell() < len(self.stdin.getbuffer())
+                result = 0xFF if pending else 0x00
+        elif func == 0x0C:
+            result = 0x22
+        regs[REG_A] = regs[REG_L] = result
+        regs[REG_B] = regs[REG_H] = 0x00
+
+
+def _probe_hl(env, operand):
+    return (env.regs[REG_H] << 8) | env.regs[REG_L]
+
+
+def _probe_bc(env, operand):
+    return (env.regs[REG_B] << 8) | env.regs[REG_C]
+
+
+def _probe_de(env, operand):
+    return (env.regs[REG_D] << 8) | env.regs[REG_E]
+
+
+def _probe_sp(env, operand):
+    return env.sp
+
+
+def _probe_operand(env, operand):
+    return operand
+
+
+def build_write_probes():
+    probes = [None] * 0x100
+    for op in (0x34, 0x35, 0x36, 0x70, 0x71, 0x72, 0x73, 0x74, 0x75, 0x77):
+        probes[op] = _probe_hl
+    probes[0x02] = _probe_bc
+    probes[0x12] = _probe_de
+    probes[0x22] = probes[0x32] = _probe_operand
+    for op in range(0xC0, 0x100):
+        if op & 0x07 in (0x04, 0x05, 0x07) or op in (0xCD, 0xDD, 0xED, 0xFD,
+                                                        0xE3):
+            probes[op] = _probe_sp
+    return tuple(probes)
+
+
+# write probes the compiled blocks inline
+PROBE_SOURCE = {
+    _probe_hl: f"regs[{REG_H}] << 8 | regs[{REG_L}]",
+    _probe_bc: f"regs[{REG_B}] << 8 | regs[{REG_C}]",
+    _probe_de: f"regs[{REG_D}] << 8 | regs[{REG_E}]",
+    _probe_sp: "env.sp",
+}
+
+
+class Block:
+    __slots__ = ("start", "end", "entries", "alive", "raw", "generation",
+                 "run")
+
+    def __init__(self, start, end, entries, generation=0):
+        self.start = start
+        self.end = end
+        self.entries = entries
+        self.alive = True
+        self.raw = b""
+        self.generation = generation
+        self.run = None
+
+    def __repr__(self):
+        return (f"<Block {self.start:#06x}..{self.end:#06x}, "
+                f"{len(self.entries)} instrs>")
+
+    def covers(self, addr):
+        return (addr - self.start) & 0xFFFF < self.end - self.start
+
+    def pages(self):
+        return set((addr & 0xFFFF) >> 8
+                   for addr in range(self.start, self.end, 0x100)) \
+            | {((self.end - 1) & 0xFFFF) >> 8}
+
+    def image(self, mem):
+        return bytes(mem[self.start:self.end]) \
+            + bytes(mem[:max(self.end - 0x10000, 0)])
+
+    def executed(self, next_pc):
+        for idx, entry in enumerate(self.entries, 1):
+            if entry[2] == next_pc:
+                return idx
+        return len(self.entries)
+
+
+class BlockCache:
+    def __init__(self, max_block=BLOCK_MAX_INSTRS):
+        self.max_block = max_block
+        self.blocks = {}
+        self.pages = {}
+        self.code = array("I", bytes(4 * 0x10000))
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def stats(self):
+        return {"blocks": len(self.blocks), "hits": self.hits,
+                "misses": self.misses, "invalidations": self.invalidations}
+
+    def clear(self):
+        for block in self.blocks.values():
+            block.alive = False
+        self.blocks.clear()
+        self.pages.clear()
+        # in place, the compiled blocks and run_blocks hold on to it
+        self.code[:] = array("I", bytes(4 * 0x10000))
+
+    def translate(self, env, start):
+        self.misses += 1
+        mem = env.mem
+        table = env.table
+        handlers = env.handlers
+        entries = []
+        # entries that look at (or jump from) pc get it set first, the
+        # others leave it to the end of the block
+        reads_pc = []
+        wide = []
+        pc = start
+        while len(entries) < self.max_block:
+            op = mem[pc & 0xFFFF]
+            opcode = table[op]
+            length = opcode.length if opcode else 1
+            operand = None
+            if length == 2:
+                operand = mem[(pc + 1) & 0xFFFF]
+            elif length == 3:
+                operand = mem[(pc + 1) & 0xFFFF] | (mem[(pc + 2) & 0xFFFF] << 8)
+            pc += length
+            entries.append((handlers[op], operand, pc & 0xFFFF,
+                            WRITE_PROBES[op]))
+            reads_pc.append(opcode is None or opcode.flow != FLOW_NONE
+                            or op in (0xD3, 0xDB))
+            # SHLD and the stack writes store two bytes, the rest one
+            wide.append(op == 0x22 or WRITE_PROBES[op] is _probe_sp)
+            if opcode is None or opcode.flow != FLOW_NONE or pc > 0xFFFF:
+                break
+        block = Block(start, pc, entries, self.generation)
+        block.raw = block.image(mem)
+        block.run = self._compile(block, reads_pc, wide)
+        self.blocks[start] = block
+        code = self.code
+        for addr in range(start, pc):
+            code[addr & 0xFFFF] += 1
+        for page in block.pages():
+            self.pages.setdefault(page, set()).add(start)
+        return block
+
+    def _compile(self, block, reads_pc, wide):
+        # straight-line python with the handlers and operands as constants,
+        # returning the number of instructions it ran; a block that jumps
+        # back to its own start loops in here for as long as the budget lets
+        # it, rather than going back through run_blocks every pass
+        entries = block.entries
+        fn, target, next_pc, _ = entries[-1]
+        namespace = {"cache": self, "code": self.code, "block": block}
+        lines = ["def run(env, budget):"]
+        branch = None
+        if fn is _op_jmp:
+            branch = "True"
+        elif fn in JUMP_CONDITIONS:
+            branch = "env.f & {} == {}".format(*JUMP_CONDITIONS[fn])
+        loop = branch is not None and target == block.start \
+            and not any(reads_pc[:-1])
+        indent = "    "
+        done = ""
+        if loop:
+            lines += ["    done = 0", "    while True:"]
+            indent = "        "
+            done = "done + "
+        body = entries[:-1] if branch is not None else entries
+        for idx, (fn, operand, next_pc, probe) in enumerate(body, 1):
+            namespace[f"h{idx}"] = fn
+            if reads_pc[idx - 1]:
+                lines.append(f"{indent}env.pc = {next_pc}")
+            lines.append(f"{indent}h{idx}(env)" if operand is None
+                         else f"{indent}h{idx}(env, {operand})")
+            if probe is None:
                 continue
-            instr = instr.copy()
-            operands = []
-            for op in instr.operands:
-                if op.ty == "d16":
-                    try:
-                        data = format(byte_stack.pop(0) | (byte_stack.pop(0) << 8),
-                                'x').rjust(4, '0')
-                        operands.append(f"$0x{data}")
-                    except IndexError:
-                        int_halt(CODE_MAP['BIN_ARG'], "Disassembler Error",
-                                 f"Insufficient arguments for {instr.op_ident!r}"
-                                 " expected 1 `d16` arg, got none")
-                elif op.ty == "d8":
-                    try:
-                        data = format(byte_stack.pop(0), 'x').rjust(2,'0')
-                        operands.append(f"$0x{data}")
-                    except IndexError:
-                        int_halt(CODE_MAP['BIN_ARG'], "Disassembler Error",
-                                f"Insufficient arguments for {instr.op_ident!r}"
-                                " expected 1 `d8` arg, got none")
-                elif op.ty == "a16":
-                    try:
-                        addr = byte_stack.pop(0) | (byte_stack.pop(0) << 8)
-                        if addr - self.org >= 0:
-                            addr -= self.org
-                            instr._note += f"(reloc. -{hex(self.org)}) "
-                        else:
-                            instr._note = f"(reloc. out of bounds) "
-                        data = format(addr, 'x').rjust(4, '0')
-                        operands.append(f"(0x{data})")
-                    except IndexError:
-                        int_halt(CODE_MAP['BIN_ARG'], "Disassembler Error",
-                                f"Insufficient arguments for {instr.op_ident!r}"
-                                "expected 1 `a16` arg, got none")
-                op.data = data if not len(data) % 2 else f"\x00{data}"
-            if instr.op_ident.startswith("*"):
-                instr._note += f"(unused op.) "
-            yield (instr, *operands)
+            if (source := PROBE_SOURCE.get(probe)) is None:
+                namespace[f"p{idx}"] = probe
+                source = f"p{idx}(env, {operand})"
+            written = "code[addr] or code[(addr + 1) & 0xFFFF]" \
+                if wide[idx - 1] else "code[addr]"
+            lines += [f"{indent}addr = {source}",
+                      f"{indent}if {written}:",
+                      f"{indent}    cache.invalidate(addr)",
+                      f"{indent}    if not block.alive:"]
+            if not reads_pc[idx - 1]:
+                lines.append(f"{indent}        env.pc = {next_pc}")
+            lines.append(f"{indent}        return {done}{idx}")
+        count = len(entries)
+        if branch is None:
+            if not reads_pc[-1]:
+                lines.append(f"    env.pc = {entries[-1][2]}")
+            lines.append(f"    return {count}")
+        elif loop:
+            lines += [f"        done += {count}",
+                      f"        if not {branch}:",
+                      f"            env.pc = {entries[-1][2]}",
+                      "            return done",
+                      f"        if done + {count} > budget:",
+                      f"            env.pc = {target}",
+                      "            return done"]
+        else:
+            lines += [f"    env.pc = {target} if {branch} "
+                      f"else {entries[-1][2]}",
+                      f"    return {count}"]
+        if any("regs[" in line for line in lines):
+            lines.insert(1, "    regs = env.regs")
+        exec(compile("\n".join(lines), f"<block {block.start:#06x}>",
+                     "exec"), namespace)
+        return namespace["run"]
+
+    def revalidate(self, block, mem):
+        if block.image(mem) == block.raw:
+            block.generation = self.generation
+            return True
+        self.remove(block)
+        return False
+
+    def invalidate(self, addr):
+        for page in {addr >> 8, ((addr + 1) & 0xFFFF) >> 8}:
+            for start in tuple(self.pages.get(page, ())):
+                block = self.blocks[start]
+                if block.covers(addr) or block.covers((addr + 1) & 0xFFFF):
+                    self.remove(block)
+
+    def remove(self, block):
+        self.invalidations += 1
+        block.alive = False
+        del self.blocks[block.start]
+        for addr in range(block.start, block.end):
+            self.code[addr & 0xFFFF] -= 1
+        for page in block.pages():
+            self.pages[page].discard(block.start)
+
+
+def _op_illegal(env):
+    pc = (env.pc - 1) & 0xFFFF
+    int_halt(CODE_MAP['BIN_ILL'], "Emulator Error",
+             f"No handler for byte {env.mem[pc]!r} at {pc:#06x}")
+
+
+def _op_nop(env):
+    pass
+
+
+def _op_hlt(env):
+    raise CpuHalt
+
+
+def _mov(dst, src):
+    if src == REG_M:
+        def fn(env):
+            regs = env.regs
+            regs[dst] = env.mem[(regs[REG_H] << 8) | regs[REG_L]]
+    elif dst == REG_M:
+        def fn(env):
+            regs = env.regs
+            env.mem[(regs[REG_H] << 8) | regs[REG_L]] = regs[src]
+    else:
+        def fn(env):
+            regs = env.regs
+            regs[dst] = regs[src]
+    return fn
+
+
+def _mvi(dst):
+    if dst == REG_M:
+        def fn(env, d8):
+            regs = env.regs
+            env.mem[(regs[REG_H] << 8) | regs[REG_L]] = d8
+    else:
+        def fn(env, d8):
+            env.regs[dst] = d8
+    return fn
+
+
+def _inr(dst):
+    if dst == REG_M:
+        def fn(env):
+            regs = env.regs
+            addr = (regs[REG_H] << 8) | regs[REG_L]
+            res = (env.mem[addr] + 1) & 0xFF
+            env.mem[addr] = res
+            env.f = (env.f & F_CY) | SZP[res] | (0 if res & 0x0F else F_AC)
+    else:
+        def fn(env):
+            regs = env.regs
+            res = regs[dst] = (regs[dst] + 1) & 0xFF
+            env.f = (env.f & F_CY) | SZP[res] | (0 if res & 0x0F else F_AC)
+    return fn
+
+
+def _dcr(dst):
+    if dst == REG_M:
+        def fn(env):
+            regs = env.regs
+            addr = (regs[REG_H] << 8) | regs[REG_L]
+            res = (env.mem[addr] - 1) & 0xFF
+            env.mem[addr] = res
+            env.f = (env.f & F_CY) | SZP[res] \
+                | (0 if res & 0x0F == 0x0F else F_AC)
+    else:
+        def fn(env):
+            regs = env.regs
+            res = regs[dst] = (regs[dst] - 1) & 0xFF
+            env.f = (env.f & F_CY) | SZP[res] \
+                | (0 if res & 0x0F == 0x0F else F_AC)
+    return fn
+
+
+def _alu_add(env, value):
+    regs = env.regs
+    a = regs[REG_A]
+    res = a + value
+    regs[REG_A] = res & 0xFF
+    env.f = SZP[res & 0xFF] | (res >> 8) | (((a & 0x0F) + (value & 0x0F)) & F_AC)
+
+
+def _alu_adc(env, value):
+    regs = env.regs
+    a = regs[REG_A]
+    carry = env.f & F_CY
+    res = a + value + carry
+    regs[REG_A] = res & 0xFF
+    env.f = SZP[res & 0xFF] | (res >> 8) \
+        | (((a & 0x0F) + (value & 0x0F) + carry) & F_AC)
+
+
+def _alu_sub(env, value):
+    regs = env.regs
+    a = regs[REG_A]
+    res = a - value
+    regs[REG_A] = res & 0xFF
+    env.f = SZP[res & 0xFF] | ((res >> 8) & F_CY) \
+        | (((a & 0x0F) + (~value & 0x0F) + 1) & F_AC)
+
+
+def _alu_sbb(env, value):
+    regs = env.regs
+    a = regs[REG_A]
+    carry = env.f & F_CY
+    res = a - value - carry
+    regs[REG_A] = res & 0xFF
+    env.f = SZP[res & 0xFF] | ((res >> 8) & F_CY) \
+        | (((a & 0x0F) + (~value & 0x0F) + (carry ^ 1)) & F_AC)
+
+
+def _alu_ana(env, value):
+    regs = env.regs
+    a = regs[REG_A]
+    res = regs[REG_A] = a & value
+    env.f = SZP[res] | (((a | value) & 0x08) << 1)
+
+
+def _alu_xra(env, value):
+    regs = env.regs
+    res = regs[REG_A] = regs[REG_A] ^ value
+    env.f = SZP[res]
+
+
+def _alu_ora(env, value):
+    regs = env.regs
+    res = regs[REG_A] = regs[REG_A] | value
+    env.f = SZP[res]
+
+
+def _alu_cmp(env, value):
+    a = env.regs[REG_A]
+    res = a - value
+    env.f = SZP[res & 0xFF] | ((res >> 8) & F_CY) \
+        | (((a & 0x0F) + (~value & 0x0F) + 1) & F_AC)
+
+
+ALU_OPS = (_alu_add, _alu_adc, _alu_sub, _alu_sbb,
+           _alu_ana, _alu_xra, _alu_ora, _alu_cmp)
+
+
+def _alu(op, src):
+    if src == REG_M:
+        def fn(env):
+            regs = env.regs
+            op(env, env.mem[(regs[REG_H] << 8) | regs[REG_L]])
+    else:
+        def fn(env):
+            op(env, env.regs[src])
+    return fn
+
+
+def _alu_imm(op):
+    def fn(env, d8):
+        op(env, d8)
+    return fn
+
+
+def _lxi(pair):
+    if pair == 3:
+        def fn(env, d16):
+            env.sp = d16
+    else:
+        hi, lo = pair * 2, pair * 2 + 1
+        def fn(env, d16):
+            regs = env.regs
+            regs[hi] = d16 >> 8
+            regs[lo] = d16 & 0xFF
+    return fn
+
+
+def _inx(pair, delta):
+    if pair == 3:
+        def fn(env):
+            env.sp = (env.sp + delta) & 0xFFFF
+    else:
+        hi, lo = pair * 2, pair * 2 + 1
+        def fn(env):
+            regs = env.regs
+            value = (((regs[hi] << 8) | regs[lo]) + delta) & 0xFFFF
+            regs[hi] = value >> 8
+            regs[lo] = value & 0xFF
+    return fn
+
+
+def _dad(pair):
+    if pair == 3:
+        def fn(env):
+            regs = env.regs
+            res = ((regs[REG_H] << 8) | regs[REG_L]) + env.sp
+            regs[REG_H] = (res >> 8) & 0xFF
+            regs[REG_L] = res & 0xFF
+            env.f = (env.f & ~F_CY) | (res >> 16)
+    else:
+        hi, lo = pair * 2, pair * 2 + 1
+        def fn(env):
+            regs = env.regs
+            res = ((regs[REG_H] << 8) | regs[REG_L]) \
+                + ((regs[hi] << 8) | regs[lo])
+            regs[REG_H] = (res >> 8) & 0xFF
+            regs[REG_L] = res & 0xFF
+            env.f = (env.f & ~F_CY) | (res >> 16)
+    return fn
+
+
+def _stax(pair):
+    hi, lo = pair * 2, pair * 2 + 1
+    def fn(env):
+        regs = env.regs
+        env.mem[(regs[hi] << 8) | regs[lo]] = regs[REG_A]
+    return fn
+
+
+def _ldax(pair):
+    hi, lo = pair * 2, pair * 2 + 1
+    def fn(env):
+        regs = env.regs
+        regs[REG_A] = env.mem[(regs[hi] << 8) | regs[lo]]
+    return fn
+
+
+def _op_shld(env, a16):
+    regs = env.regs
+    mem = env.mem
+    mem[a16] = regs[REG_L]
+    mem[(a16 + 1) & 0xFFFF] = regs[REG_H]
+
+
+def _op_lhld(env, a16):
+    regs = env.regs
+    mem = env.mem
+    regs[REG_L] = mem[a16]
+    regs[REG_H] = mem[(a16 + 1) & 0xFFFF]
+
+
+def _op_sta(env, a16):
+    env.mem[a16] = env.regs[REG_A]
+
+
+def _op_lda(env, a16):
+    env.regs[REG_A] = env.mem[a16]
+
+
+def _op_rlc(env):
+    regs = env.regs
+    a = regs[REG_A]
+    carry = a >> 7
+    regs[REG_A] = ((a << 1) | carry) & 0xFF
+    env.f = (env.f & ~F_CY) | carry
+
+
+def _op_rrc(env):
+    regs = env.regs
+    a = regs[REG_A]
+    carry = a & 0x01
+    regs[REG_A] = (a >> 1) | (carry << 7)
+    env.f = (env.f & ~F_CY) | carry
+
+
+def _op_ral(env):
+    regs = env.regs
+    a = regs[REG_A]
+    regs[REG_A] = ((a << 1) | (env.f & F_CY)) & 0xFF
+    env.f = (env.f & ~F_CY) | (a >> 7)
+
+
+def _op_rar(env):
+    regs = env.regs
+    a = regs[REG_A]
+    regs[REG_A] = (a >> 1) | ((env.f & F_CY) << 7)
+    env.f = (env.f & ~F_CY) | (a & 0x01)
+
+
+def _op_daa(env):
+    regs = env.regs
+    a = regs[REG_A]
+    f = env.f
+    carry = f & F_CY
+    correction = 0x00
+    if f & F_AC or a & 0x0F > 0x09:
+        correction |= 0x06
+    if carry or a >> 4 > 0x09 or (a >> 4 >= 0x09 and a & 0x0F > 0x09):
+        correction |= 0x60
+        carry = F_CY
+    res = a + correction
+    regs[REG_A] = res & 0xFF
+    env.f = SZP[res & 0xFF] | carry \
+        | (((a & 0x0F) + (correction & 0x0F)) & F_AC)
+
+
+def _op_cma(env):
+    env.regs[REG_A] ^= 0xFF
+
+
+def _op_stc(env):
+    env.f |= F_CY
+
+
+def _op_cmc(env):
+    env.f ^= F_CY
+
+
+def _push(env, value):
+    sp = env.sp = (env.sp - 2) & 0xFFFF
+    env.mem[sp] = value & 0xFF
+    env.mem[(sp + 1) & 0xFFFF] = value >> 8
+
+
+def _pop(env):
+    sp = env.sp
+    env.sp = (sp + 2) & 0xFFFF
+    return env.mem[sp] | (env.mem[(sp + 1) & 0xFFFF] << 8)
+
+
+def _op_jmp(env, a16):
+    env.pc = a16
+
+
+def _jcc(cond):
+    mask, want = CONDITIONS[cond]
+    def fn(env, a16):
+        if env.f & mask == want:
+            env.pc = a16
+    return fn
+
+
+def _op_call(env, a16):
+    _push(env, env.pc)
+    env.pc = a16
+
+
+def _ccc(cond):
+    mask, want = CONDITIONS[cond]
+    def fn(env, a16):
+        if env.f & mask == want:
+            _push(env, env.pc)
+            env.pc = a16
+    return fn
+
+
+def _op_ret(env):
+    env.pc = _pop(env)
+
+
+def _rcc(cond):
+    mask, want = CONDITIONS[cond]
+    def fn(env):
+        if env.f & mask == want:
+            env.pc = _pop(env)
+    return fn
+
+
+def _rst(vector):
+    def fn(env):
+        _push(env, env.pc)
+        env.pc = vector
+    return fn
+
+
+def _push_pair(pair):
+    if pair == 3:
+        def fn(env):
+            _push(env, (env.regs[REG_A] << 8) | env.f)
+    else:
+        hi, lo = pair * 2, pair * 2 + 1
+        def fn(env):
+            regs = env.regs
+            _push(env, (regs[hi] << 8) | regs[lo])
+    return fn
+
+
+def _pop_pair(pair):
+    if pair == 3:
+        def fn(env):
+            value = _pop(env)
+            env.regs[REG_A] = value >> 8
+            env.f = (value & 0xD5) | F_ONE
+    else:
+        hi, lo = pair * 2, pair * 2 + 1
+        def fn(env):
+            value = _pop(env)
+            regs = env.regs
+            regs[hi] = value >> 8
+            regs[lo] = value & 0xFF
+    return fn
+
+
+def _op_xthl(env):
+    regs = env.regs
+    mem = env.mem
+    sp = env.sp
+    hi = (sp + 1) & 0xFFFF
+    regs[REG_L], mem[sp] = mem[sp], regs[REG_L]
+    regs[REG_H], mem[hi] = mem[hi], regs[REG_H]
+
+
+def _op_pchl(env):
+    regs = env.regs
+    env.pc = (regs[REG_H] << 8) | regs[REG_L]
+
+
+def _op_sphl(env):
+    regs = env.regs
+    env.sp = (regs[REG_H] << 8) | regs[REG_L]
+
+
+def _op_xchg(env):
+    regs = env.regs
+    regs[REG_D], regs[REG_H] = regs[REG_H], regs[REG_D]
+    regs[REG_E], regs[REG_L] = regs[REG_L], regs[REG_E]
+
+
+def _op_out(env, d8):
+    env.io_out(d8, env.regs[REG_A])
+
+
+def _op_in(env, d8):
+    env.regs[REG_A] = env.io_in(d8) & 0xFF
+
+
+def _op_ei(env):
+    env.inte = 1
+
+
+def _op_di(env):
+    env.inte = 0
+
+
+def build_handlers():
+    handlers = [None] * 0x100
+    for op in (0x00, 0x08, 0x10, 0x18, 0x20, 0x28, 0x30, 0x38):
+        handlers[op] = _op_nop
+    for pair in range(4):
+        handlers[0x01 | pair << 4] = _lxi(pair)
+        handlers[0x03 | pair << 4] = _inx(pair, 1)
+        handlers[0x09 | pair << 4] = _dad(pair)
+        handlers[0x0B | pair << 4] = _inx(pair, -1)
+        handlers[0xC1 | pair << 4] = _pop_pair(pair)
+        handlers[0xC5 | pair << 4] = _push_pair(pair)
+    for pair in range(2):
+        handlers[0x02 | pair << 4] = _stax(pair)
+        handlers[0x0A | pair << 4] = _ldax(pair)
+    for reg in range(8):
+        handlers[0x04 | reg << 3] = _inr(reg)
+        handlers[0x05 | reg << 3] = _dcr(reg)
+        handlers[0x06 | reg << 3] = _mvi(reg)
+        handlers[0xC6 | reg << 3] = _alu_imm(ALU_OPS[reg])
+        handlers[0xC0 | reg << 3] = _rcc(reg)
+        handlers[0xC2 | reg << 3] = _jcc(reg)
+        handlers[0xC4 | reg << 3] = _ccc(reg)
+        handlers[0xC7 | reg << 3] = _rst(reg << 3)
+        for src in range(8):
+            handlers[0x40 | reg << 3 | src] = _mov(reg, src)
+            handlers[0x80 | reg << 3 | src] = _alu(ALU_OPS[reg], src)
+    handlers[0x76] = _op_hlt
+    for op, fn in ((0x07, _op_rlc), (0x0F, _op_rrc), (0x17, _op_ral),
+                   (0x1F, _op_rar), (0x22, _op_shld), (0x27, _op_daa),
+                   (0x2A, _op_lhld), (0x2F, _op_cma), (0x32, _op_sta),
+                   (0x37, _op_stc), (0x3A, _op_lda), (0x3F, _op_cmc),
+                   (0xC3, _op_jmp), (0xCB, _op_jmp), (0xC9, _op_ret),
+                   (0xD9, _op_ret), (0xCD, _op_call), (0xDD, _op_call),
+                   (0xED, _op_call), (0xFD, _op_call), (0xD3, _op_out),
+                   (0xDB, _op_in), (0xE3, _op_xthl), (0xE9, _op_pchl),
+                   (0xEB, _op_xchg), (0xF3, _op_di), (0xF9, _op_sphl),
+                   (0xFB, _op_ei)):
+        handlers[op] = fn
+    return tuple(handlers)
+
+
+def _decode_region(job, opcode_map=None):
+    source, region, on_error = job
+    opcode_map = opcode_map or OPCODE_MAP
+    if isinstance(source, str):
+        disasm = Disassembler.from_file(source, opcode_map, region.address,
+                                        region.offset, region.length,
+                                        on_error)
+    else:
+        disasm = Disassembler(memoryview(source)[region.offset:region.offset
+                                                 + region.length],
+                              opcode_map, region.address, on_error)
+    with disasm:
+        if len(disasm.data) != region.length:
+            raise _internal_error(f"memory map region {region} runs past "
+                                  f"the end of the image")
+        if region.kind == "data":
+            data = bytes(disasm._buffer())
+            columns = (array("I", range(len(data))), array("B", data),
+                       array("H", bytes(2 * len(data))),
+                       array("B", b"\x01" * len(data)),
+                       array("B", bytes((FLAG_DATA,)) * len(data)))
+        else:
+            columns = disasm.decode_batch().columns
+        return columns, disasm.errors
+
+
+def _decode_segment(job):
+    data, base, length, org = job
+    disasm = Disassembler(data, OPCODE_MAP, org, on_error="count")
+    batch = RecordBatch()
+    append = batch.append
+    for record in disasm._sweep(0):
+        if record.offset >= length:
+            break
+        record.offset += base
+        append(record)
+    return base, base + length, batch.columns
+
+
+_BATCH = {}
+
+
+def _batch_init(org, fmt, output_dir, cache_dir=None):
+    # runs once per worker; the decode table is built by the import itself
+    _BATCH.update(org=org, fmt=fmt, output_dir=output_dir, cache=None)
+    if cache_dir is not None:
+        _BATCH["cache"] = DecodeCache(cache_dir)
+
+
+def _batch_one(job):
+    path, name = job
+    fmt = _BATCH["fmt"]
+    result = {"path": path, "bytes": 0, "instructions": 0, "errors": 0,
+              "output": None, "failure": None, "cached": None}
+    start = time.perf_counter()
+    try:
+        with Disassembler.from_file(path, org=_BATCH["org"],
+                                    on_error="count") as disasm:
+            result["bytes"] = len(disasm.data)
+            if (cache := _BATCH["cache"]) is not None:
+                hits = cache.hits
+                records = cache.decode(disasm)
+                result["cached"] = cache.hits > hits
+            else:
+                records = disasm.iterate_records()
+            if fmt == "none":
+                result["instructions"] = sum(1 for _ in records)
+            else:
+                out = os.path.join(_BATCH["output_dir"],
+                                   name + BATCH_SUFFIXES[fmt])
+                os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+                mode = 'wb' if fmt in BINARY_FORMATS else 'w'
+                with open(out, mode) as file:
+                    result["instructions"] = write_records(
+                        file, records, disasm.renderer, fmt)
+                result["output"] = out
+            result["errors"] = len(disasm.errors)
+    except (OSError, ValueError, DisassemblerError, SystemExit) as exc:
+        result["failure"] = f"{type(exc).__name__}: {exc}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _emit_blocks(file, lines):
+    written = 0
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) == LISTING_BLOCK:
+            file.write("\n".join(block) + "\n")
+            written += len(block)
+            block.clear()
+    if block:
+        file.write("\n".join(block) + "\n")
+        written += len(block)
+    return written
+
+
+def _as_batch(records):
+    if isinstance(records, RecordBatch):
+        return records
+    batch = RecordBatch()
+    append = batch.append
+    for record in records:
+        append(record)
+    return batch
+
+
+def emit_listing(file, records, renderer):
+    written = 0
+    for text in renderer.listing(records):
+        file.write(text)
+        # instruction lines start with "+", label lines don't
+        written += text.count("\n+") + text.startswith("+")
+    return written
+
+
+def emit_jsonl(file, records, renderer):
+    mnemonic = renderer.mnemonic
+    texts = {}
+
+    def line(record):
+        key = (record.opcode, record.operand, record.length, record.flags)
+        if record.flags & FLAG_STRING:
+            text = json.dumps(mnemonic(record))
+        elif (text := texts.get(key)) is None:
+            if len(texts) >= RENDER_CACHE_SIZE:
+                texts.clear()
+            text = texts[key] = json.dumps(mnemonic(record))
+        return JSONL_TEMPLATE % (
+            record.offset, record.opcode,
+            "null" if record.operand is None else record.operand,
+            record.length, record.flags, text)
+    return _emit_blocks(file, map(line, records))
+
+
+def _asm_number(value, digits):
+    text = f"{value:0{digits}X}H"
+    return f"0{text}" if text[0] in "ABCDEF" else text
+
+
+def emit_asm(file, records, renderer):
+    # labels need every branch target up front, so this is two passes over
+    # the (compact) decoded columns rather than over rendered text
+    batch = _as_batch(records)
+    table = renderer.table
+    org = renderer.org
+    names = renderer.symbols.names if renderer.symbols is not None \
+        else [None] * 0x10000
+    offsets = batch.offsets
+    size = offsets[-1] + batch.lengths[-1] if len(batch) else 0
+
+    def starts_at(offset):
+        idx = bisect_left(offsets, offset)
+        return idx < len(offsets) and offsets[idx] == offset
+
+    labels = {}
+    equates = {}
+    for record in batch:
+        if record.flags & FLAG_WORD:
+            target = record.opcode | record.operand << 8
+        elif record.flags & (FLAG_DATA | FLAG_UNDOCUMENTED) \
+                or table[record.opcode].kinds[:1] != ("a16",):
+            continue
+        else:
+            target = record.operand
+        if 0 <= target - org < size and starts_at(target - org):
+            labels[target - org] = names[target] or f"L{target:04X}"
+        elif names[target]:
+            equates[target] = names[target]
+    if renderer.symbols is not None:
+        for address in renderer.symbols.between(org, org + size):
+            if address - org not in labels and starts_at(address - org):
+                labels[address - org] = names[address]
+
+    def operand(value):
+        if value - org in labels:
+            return labels[value - org]
+        return equates.get(value) or _asm_number(value, 4)
+
+    def line(record):
+        offset = record.offset
+        label = f"{labels[offset]}:" if offset in labels else ""
+        opcode = table[record.opcode]
+        if record.flags & FLAG_WORD:
+            return f"{label}\tDW\t" \
+                f"{operand(record.opcode | record.operand << 8)}"
+        if record.flags & FLAG_STRING:
+            return f"{label}\tDB\t" + _text_items(
+                renderer.raw_bytes(record), "'{}'".format,
+                lambda byte: _asm_number(byte, 2))
+        if record.flags & (FLAG_DATA | FLAG_UNDOCUMENTED):
+            data = ','.join(_asm_number(byte, 2)
+                            for byte in renderer.raw_bytes(record))
+            comment = f"\t; {opcode.mnemonic.lstrip('*').split()[0]}" \
+                if record.flags & FLAG_UNDOCUMENTED else ""
+            return f"{label}\tDB\t{data}{comment}"
+        name, _, args = opcode.mnemonic.partition(" ")
+        if record.operand is not None:
+            kind = opcode.kinds[0]
+            if kind == "a16":
+                value = operand(record.operand)
+            else:
+                value = _asm_number(record.operand,
+                                    2 * OPERAND_SIZES[kind])
+            args %= value
+        return f"{label}\t{name}\t{args}" if args else f"{label}\t{name}"
+
+    for address, name in sorted(equates.items()):
+        file.write(f"{name}\tEQU\t{_asm_number(address, 4)}\n")
+    file.write(f"\tORG\t{_asm_number(org, 4)}\n")
+    written = _emit_blocks(file, map(line, batch))
+    file.write("\tEND\n")
+    return written
+
+
+def emit_columnar(file, records, renderer):
+    batch = _as_batch(records)
+    strings = sorted(batch.strings.items())
+    file.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION,
+                                    renderer.org, len(batch), len(strings)))
+    # widest item first, so every column stays naturally aligned; string
+    # records follow as offsets, lengths and their bytes back to back
+    for col, code in zip((batch.offsets, batch.operands, batch.opcodes,
+                          batch.lengths, batch.flags,
+                          [offset for offset, _ in strings],
+                          [len(data) for _, data in strings]), "IHBBBIB"):
+        col = array(code, col)
+        if sys.byteorder != "little":
+            col.byteswap()
+        file.write(col.tobytes())
+    for _, data in strings:
+        file.write(data)
+    return len(batch)
+
+
+def load_columnar(path):
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < COLUMNAR_HEADER.size:
+            raise DisassemblerError(DecodeError(
+                0, CODE_MAP['INT_ERR'], "Internal Error",
+                f"{path!r} is too short to be a columnar record file"))
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, org, count, nstrings = COLUMNAR_HEADER.unpack_from(mapped)
+    # the string lengths are the last fixed-size column
+    fixed = COLUMNAR_HEADER.size + 9 * count + 5 * nstrings
+    if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION \
+            or size < fixed \
+            or size != fixed + sum(mapped[fixed - nstrings:fixed]):
+        mapped.close()
+        raise DisassemblerError(DecodeError(
+            0, CODE_MAP['INT_ERR'], "Internal Error",
+            f"{path!r} isn't a version {COLUMNAR_VERSION} columnar record "
+            f"file"))
+    view = memoryview(mapped)
+    columns = []
+    pos = COLUMNAR_HEADER.size
+    for code in "IHBBB":
+        end = pos + count * array(code).itemsize
+        if sys.byteorder == "little":
+            columns.append(view[pos:end].cast(code))
+        else:
+            col = array(code, bytes(view[pos:end]))
+            col.byteswap()
+            columns.append(col)
+        pos = end
+    offsets, operands, opcodes, lengths, flags = columns
+    starts = array("I", bytes(view[pos:pos + 4 * nstrings]))
+    if sys.byteorder != "little":
+        starts.byteswap()
+    pos += 4 * nstrings
+    strings = {}
+    data = fixed
+    for start, length in zip(starts, view[pos:pos + nstrings]):
+        strings[start] = bytes(view[data:data + length])
+        data += length
+    return org, RecordBatch.from_columns(offsets, opcodes, operands, lengths,
+                                         flags, strings)
+
+
+EMITTERS = {
+    "listing": emit_listing,
+    "jsonl": emit_jsonl,
+    "asm": emit_asm,
+    "columnar": emit_columnar,
+}
+
+
+class DecodeCache:
+    def __init__(self, directory=None, max_bytes=DECODE_CACHE_SIZE):
+        if directory is None:
+            directory = os.path.join(
+                os.environ.get("XDG_CACHE_HOME")
+                or os.path.join(os.path.expanduser("~"), ".cache"),
+                "unazed_disasm")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bytes in the directory as of the last scan plus what this cache
+        # stored since; None until the first store scans it
+        self.total = None
+
+    def key(self, disasm):
+        digest = hashlib.sha256(disasm._buffer())
+        digest.update(struct.pack("<QI", disasm.org, DECODER_VERSION))
+        digest.update(disasm.on_error.encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + DECODE_CACHE_SUFFIX)
+
+    def decode(self, disasm):
+        if disasm.table is not DECODE_TABLE:
+            return disasm.decode_batch()
+        path = self.path(self.key(disasm))
+        try:
+            org, batch = load_columnar(path)
+        except (OSError, DisassemblerError):
+            batch = None
+        if batch is not None:
+            self.hits += 1
+            os.utime(path)
+            self._replay_errors(disasm, batch)
+            return batch
+        self.misses += 1
+        batch = disasm.decode_numpy() if numpy is not None \
+            else disasm.decode_batch()
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'wb') as file:
+            emit_columnar(file, batch, disasm.renderer)
+            stored = file.tell()
+        try:
+            stored -= os.stat(path).st_size
+        except FileNotFoundError:
+            pass
+        os.replace(temp, path)
+        if self.total is not None:
+            self.total += stored
+        if self.total is None or self.total > self.max_bytes:
+            self.evict()
+        return batch
+
+    @staticmethod
+    def _replay_errors(disasm, batch):
+        # every byte decodes with the stock table, so the only error a
+        # decode can hit is an instruction cut off by the end of the image
+        disasm.errors.clear()
+        size = len(disasm._buffer())
+        if not (count := len(batch)):
+            pos = 0 if size else None
+        elif batch.flags[count - 1] & FLAG_DATA:
+            pos = int(batch.offsets[count - 1])
+        else:
+            pos = int(batch.offsets[count - 1] + batch.lengths[count - 1])
+        if pos is not None and pos < size:
+            disasm._truncated(disasm.table[disasm._buffer()[pos]], pos)
+
+    def entries(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(DECODE_CACHE_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, target=None):
+        if target is None:
+            target = int(self.max_bytes * DECODE_CACHE_LOW_WATER)
+        entries = sorted(self.entries())
+        if (total := sum(size for _, size, _ in entries)) <= self.max_bytes:
+            target = total
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self.total = total
+        return total
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.total = 0
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+def write_records(file, records, renderer, fmt="listing"):
+    return EMITTERS[fmt](file, records, renderer)
+
+
+def _batch_jobs(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    yield full, os.path.relpath(full, path)
+        else:
+            yield path, os.path.basename(path)
+
+
+def batch_disassemble(paths, output_dir=".", org=0x00, fmt="listing",
+                      workers=None, chunksize=BATCH_CHUNKSIZE, cache_dir=None):
+    if fmt not in BATCH_FORMATS:
+        raise _internal_error(f"unexpected batch format {fmt!r}, expected "
+                              f"one of {BATCH_FORMATS}")
+    if isinstance(paths, str):
+        paths = [paths]
+    jobs = list(_batch_jobs(paths))
+    start = time.perf_counter()
+    if workers == 1:
+        _batch_init(org, fmt, output_dir, cache_dir)
+        results = list(map(_batch_one, jobs))
+    else:
+        with ProcessPoolExecutor(workers, initializer=_batch_init,
+                                 initargs=(org, fmt, output_dir,
+                                           cache_dir)) as pool:
+            results = list(pool.map(_batch_one, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(result["bytes"] for result in results)
+    total_instrs = sum(result["instructions"] for result in results)
+    return {
+        "files": len(results),
+        "failed": sum(1 for result in results if result["failure"]),
+        "cache_hits": sum(1 for result in results if result["cached"]),
+        "bytes": total_bytes,
+        "instructions": total_instrs,
+        "seconds": elapsed,
+        "bytes_per_second": total_bytes / elapsed if elapsed else None,
+        "instructions_per_second":
+            total_instrs / elapsed if elapsed else None,
+        "results": results,
+    }
+
 
 def int_halt(code, msg, add=None, warn=False):
     msg = f"\n[{code}]\tfatal\t\t{msg}\n" \
@@ -133,1079 +3227,432 @@ def int_halt(code, msg, add=None, warn=False):
 
 
 OPCODE_MAP = dict(map(Instruction.unpack, [
-    Instruction("NOP", "\x00",
-                fn=lambda env:
-                    None
-                ),
+    Instruction("NOP", "\x00"),
     Instruction("LXI B,%s", "\x01",
-                Operand(None, "d16", 0x02),
-                fn=lambda env, d16:
-                    None
-                ),
-    Instruction("STAX B", "\x02",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INX B", "\x03",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR B", "\x04",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR B", "\x05",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d16", 0x02)),
+    Instruction("STAX B", "\x02"),
+    Instruction("INX B", "\x03"),
+    Instruction("INR B", "\x04"),
+    Instruction("DCR B", "\x05"),
     Instruction("MVI B,%s", "\x06",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RLC", "\x07",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x08",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DAD B", "\x09",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("LDAX B", "\x0A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCX B", "\x0B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR C", "\x0C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR C", "\x0D",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RLC", "\x07"),
+    Instruction("*NOP", "\x08"),
+    Instruction("DAD B", "\x09"),
+    Instruction("LDAX B", "\x0A"),
+    Instruction("DCX B", "\x0B"),
+    Instruction("INR C", "\x0C"),
+    Instruction("DCR C", "\x0D"),
     Instruction("MVI C,%s", "\x0E",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RRC", "\x0F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x10",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RRC", "\x0F"),
+    Instruction("*NOP", "\x10"),
     Instruction("LXI D,%s", "\x11",
-                Operand(None, "d16", 0x02),
-                fn=lambda env, d16:
-                    None
-                ),
-    Instruction("STAX D", "\x12",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INX D", "\x13",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR D", "\x14",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR D", "\x15",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d16", 0x02)),
+    Instruction("STAX D", "\x12"),
+    Instruction("INX D", "\x13"),
+    Instruction("INR D", "\x14"),
+    Instruction("DCR D", "\x15"),
     Instruction("MVI D,%s", "\x16",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RAL", "\x17",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x18",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DAD D", "\x19",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("LDAX D", "\x1A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCX D", "\x1B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR E", "\x1C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR E", "\x1D",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RAL", "\x17"),
+    Instruction("*NOP", "\x18"),
+    Instruction("DAD D", "\x19"),
+    Instruction("LDAX D", "\x1A"),
+    Instruction("DCX D", "\x1B"),
+    Instruction("INR E", "\x1C"),
+    Instruction("DCR E", "\x1D"),
     Instruction("MVI E,%s", "\x1E",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RAR", "\x1F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x20",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RAR", "\x1F"),
+    Instruction("*NOP", "\x20"),
     Instruction("LXI H,%s", "\x21",
-                Operand(None, "d16", 0x02),
-                fn=lambda env, d16:
-                    None
-                ),
+                Operand(None, "d16", 0x02)),
     Instruction("SHLD %s", "\x22",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("INX H", "\x23",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR H", "\x24",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR H", "\x25",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("INX H", "\x23"),
+    Instruction("INR H", "\x24"),
+    Instruction("DCR H", "\x25"),
     Instruction("MVI H,%s", "\x26",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("DAA", "\x27",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x28",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DAD H", "\x29",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("DAA", "\x27"),
+    Instruction("*NOP", "\x28"),
+    Instruction("DAD H", "\x29"),
     Instruction("LHLD %s", "\x2a",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("DCX H", "\x2b",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR L", "\x2c",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR L", "\x2d",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("DCX H", "\x2b"),
+    Instruction("INR L", "\x2c"),
+    Instruction("DCR L", "\x2d"),
     Instruction("MVI L,%s", "\x2e",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("CMA", "\x2f",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x30",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("CMA", "\x2f"),
+    Instruction("*NOP", "\x30"),
     Instruction("LXI SP,%s", "\x31",
-                Operand(None, "d16", 0x02),
-                fn=lambda env, d16:
-                    None
-                ),
+                Operand(None, "d16", 0x02)),
     Instruction("STA %s", "\x32",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("INX SP", "\x33",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR M", "\x34",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR M", "\x35",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("INX SP", "\x33"),
+    Instruction("INR M", "\x34"),
+    Instruction("DCR M", "\x35"),
     Instruction("MVI M,%s", "\x36",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("STC", "\x37",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*NOP", "\x38",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DAD SP", "\x39",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("STC", "\x37"),
+    Instruction("*NOP", "\x38"),
+    Instruction("DAD SP", "\x39"),
     Instruction("LDA %s", "\x3A",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("DCX SP", "\x3B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("INR A", "\x3C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("DCR A", "\x3D",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("DCX SP", "\x3B"),
+    Instruction("INR A", "\x3C"),
+    Instruction("DCR A", "\x3D"),
     Instruction("MVI A,%s", "\x3E",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("CMC", "\x3F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,B", "\x40",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,C", "\x41",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,D", "\x42",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,E", "\x43",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,H", "\x44",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,L", "\x45",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,M", "\x46",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV B,A", "\x47",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,B", "\x48",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,C", "\x49",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,D", "\x4A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,E", "\x4B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,H", "\x4C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,L", "\x4D",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,M", "\x4E",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV C,A", "\x4F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,B", "\x50",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,C", "\x51",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,D", "\x52",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,E", "\x53",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,H", "\x54",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,L", "\x55",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,M", "\x56",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV D,A", "\x57",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,B", "\x58",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,C", "\x59",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,D", "\x5A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,E", "\x5B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,H", "\x5C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,L", "\x5D",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,M", "\x5E",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV E,A", "\x5F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,B", "\x60",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,C", "\x61",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,D", "\x62",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,E", "\x63",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,H", "\x64",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,L", "\x65",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,M", "\x66",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV H,A", "\x67",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,B", "\x68",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,C", "\x69",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,D", "\x6A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,E", "\x6B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,H", "\x6C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,L", "\x6D",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,M", "\x6E",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV L,A", "\x6F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,B", "\x70",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,C", "\x71",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,D", "\x72",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,E", "\x73",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,H", "\x74",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,L", "\x75",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("HLT", "\x76",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV M,A", "\x77",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,B", "\x78",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,C", "\x79",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,D", "\x7A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,E", "\x7B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,H", "\x7C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,L", "\x7D",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,M", "\x7E",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("MOV A,A", "\x7F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD B", "\x80",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD C", "\x81",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD D", "\x82",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD E", "\x83",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD H", "\x84",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD L", "\x85",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD M", "\x86",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADD A", "\x87",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC B", "\x88",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC C", "\x89",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC D", "\x8A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC E", "\x8B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC H", "\x8C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC L", "\x8D",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC M", "\x8E",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ADC A", "\x8F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB B", "\x90",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB C", "\x91",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB D", "\x92",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB E", "\x93",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB H", "\x94",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB L", "\x95",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB M", "\x96",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SUB A", "\x97",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB B", "\x98",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB C", "\x99",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB D", "\x9A",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB E", "\x9B",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB H", "\x9C",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB L", "\x9D",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB M", "\x9E",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SBB A", "\x9F",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA B", "\xA0",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA C", "\xA1",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA D", "\xA2",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA E", "\xA3",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA H", "\xA4",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA L", "\xA5",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA M", "\xA6",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ANA A", "\xA7",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA B", "\xA8",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA C", "\xA9",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA D", "\xAA",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA E", "\xAB",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA H", "\xAC",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA L", "\xAD",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA M", "\xAE",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("XRA A", "\xAF",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA B", "\xB0",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA C", "\xB1",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA D", "\xB2",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA E", "\xB3",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA H", "\xB4",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA L", "\xB5",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA M", "\xB6",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("ORA A", "\xB7",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP B", "\xB8",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP C", "\xB9",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP D", "\xBA",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP E", "\xBB",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP H", "\xBC",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP L", "\xBD",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP M", "\xBE",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("CMP A", "\xBF",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RNZ", "\xC0",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("POP B", "\xC1",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("CMC", "\x3F"),
+    Instruction("MOV B,B", "\x40"),
+    Instruction("MOV B,C", "\x41"),
+    Instruction("MOV B,D", "\x42"),
+    Instruction("MOV B,E", "\x43"),
+    Instruction("MOV B,H", "\x44"),
+    Instruction("MOV B,L", "\x45"),
+    Instruction("MOV B,M", "\x46"),
+    Instruction("MOV B,A", "\x47"),
+    Instruction("MOV C,B", "\x48"),
+    Instruction("MOV C,C", "\x49"),
+    Instruction("MOV C,D", "\x4A"),
+    Instruction("MOV C,E", "\x4B"),
+    Instruction("MOV C,H", "\x4C"),
+    Instruction("MOV C,L", "\x4D"),
+    Instruction("MOV C,M", "\x4E"),
+    Instruction("MOV C,A", "\x4F"),
+    Instruction("MOV D,B", "\x50"),
+    Instruction("MOV D,C", "\x51"),
+    Instruction("MOV D,D", "\x52"),
+    Instruction("MOV D,E", "\x53"),
+    Instruction("MOV D,H", "\x54"),
+    Instruction("MOV D,L", "\x55"),
+    Instruction("MOV D,M", "\x56"),
+    Instruction("MOV D,A", "\x57"),
+    Instruction("MOV E,B", "\x58"),
+    Instruction("MOV E,C", "\x59"),
+    Instruction("MOV E,D", "\x5A"),
+    Instruction("MOV E,E", "\x5B"),
+    Instruction("MOV E,H", "\x5C"),
+    Instruction("MOV E,L", "\x5D"),
+    Instruction("MOV E,M", "\x5E"),
+    Instruction("MOV E,A", "\x5F"),
+    Instruction("MOV H,B", "\x60"),
+    Instruction("MOV H,C", "\x61"),
+    Instruction("MOV H,D", "\x62"),
+    Instruction("MOV H,E", "\x63"),
+    Instruction("MOV H,H", "\x64"),
+    Instruction("MOV H,L", "\x65"),
+    Instruction("MOV H,M", "\x66"),
+    Instruction("MOV H,A", "\x67"),
+    Instruction("MOV L,B", "\x68"),
+    Instruction("MOV L,C", "\x69"),
+    Instruction("MOV L,D", "\x6A"),
+    Instruction("MOV L,E", "\x6B"),
+    Instruction("MOV L,H", "\x6C"),
+    Instruction("MOV L,L", "\x6D"),
+    Instruction("MOV L,M", "\x6E"),
+    Instruction("MOV L,A", "\x6F"),
+    Instruction("MOV M,B", "\x70"),
+    Instruction("MOV M,C", "\x71"),
+    Instruction("MOV M,D", "\x72"),
+    Instruction("MOV M,E", "\x73"),
+    Instruction("MOV M,H", "\x74"),
+    Instruction("MOV M,L", "\x75"),
+    Instruction("HLT", "\x76"),
+    Instruction("MOV M,A", "\x77"),
+    Instruction("MOV A,B", "\x78"),
+    Instruction("MOV A,C", "\x79"),
+    Instruction("MOV A,D", "\x7A"),
+    Instruction("MOV A,E", "\x7B"),
+    Instruction("MOV A,H", "\x7C"),
+    Instruction("MOV A,L", "\x7D"),
+    Instruction("MOV A,M", "\x7E"),
+    Instruction("MOV A,A", "\x7F"),
+    Instruction("ADD B", "\x80"),
+    Instruction("ADD C", "\x81"),
+    Instruction("ADD D", "\x82"),
+    Instruction("ADD E", "\x83"),
+    Instruction("ADD H", "\x84"),
+    Instruction("ADD L", "\x85"),
+    Instruction("ADD M", "\x86"),
+    Instruction("ADD A", "\x87"),
+    Instruction("ADC B", "\x88"),
+    Instruction("ADC C", "\x89"),
+    Instruction("ADC D", "\x8A"),
+    Instruction("ADC E", "\x8B"),
+    Instruction("ADC H", "\x8C"),
+    Instruction("ADC L", "\x8D"),
+    Instruction("ADC M", "\x8E"),
+    Instruction("ADC A", "\x8F"),
+    Instruction("SUB B", "\x90"),
+    Instruction("SUB C", "\x91"),
+    Instruction("SUB D", "\x92"),
+    Instruction("SUB E", "\x93"),
+    Instruction("SUB H", "\x94"),
+    Instruction("SUB L", "\x95"),
+    Instruction("SUB M", "\x96"),
+    Instruction("SUB A", "\x97"),
+    Instruction("SBB B", "\x98"),
+    Instruction("SBB C", "\x99"),
+    Instruction("SBB D", "\x9A"),
+    Instruction("SBB E", "\x9B"),
+    Instruction("SBB H", "\x9C"),
+    Instruction("SBB L", "\x9D"),
+    Instruction("SBB M", "\x9E"),
+    Instruction("SBB A", "\x9F"),
+    Instruction("ANA B", "\xA0"),
+    Instruction("ANA C", "\xA1"),
+    Instruction("ANA D", "\xA2"),
+    Instruction("ANA E", "\xA3"),
+    Instruction("ANA H", "\xA4"),
+    Instruction("ANA L", "\xA5"),
+    Instruction("ANA M", "\xA6"),
+    Instruction("ANA A", "\xA7"),
+    Instruction("XRA B", "\xA8"),
+    Instruction("XRA C", "\xA9"),
+    Instruction("XRA D", "\xAA"),
+    Instruction("XRA E", "\xAB"),
+    Instruction("XRA H", "\xAC"),
+    Instruction("XRA L", "\xAD"),
+    Instruction("XRA M", "\xAE"),
+    Instruction("XRA A", "\xAF"),
+    Instruction("ORA B", "\xB0"),
+    Instruction("ORA C", "\xB1"),
+    Instruction("ORA D", "\xB2"),
+    Instruction("ORA E", "\xB3"),
+    Instruction("ORA H", "\xB4"),
+    Instruction("ORA L", "\xB5"),
+    Instruction("ORA M", "\xB6"),
+    Instruction("ORA A", "\xB7"),
+    Instruction("CMP B", "\xB8"),
+    Instruction("CMP C", "\xB9"),
+    Instruction("CMP D", "\xBA"),
+    Instruction("CMP E", "\xBB"),
+    Instruction("CMP H", "\xBC"),
+    Instruction("CMP L", "\xBD"),
+    Instruction("CMP M", "\xBE"),
+    Instruction("CMP A", "\xBF"),
+    Instruction("RNZ", "\xC0"),
+    Instruction("POP B", "\xC1"),
     Instruction("JNZ %s", "\xC2",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("JMP %s", "\xC3",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("CNZ %s", "\xC4",
-                Operand(None, "a16", 0x02),
-                fn=lambda env:
-                    None
-                ),
-    Instruction("PUSH B", "\xC5",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("PUSH B", "\xC5"),
     Instruction("ADI %s", "\xC6",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 0", "\xC7",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RZ", "\xC8",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RET", "\xC9",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 0", "\xC7"),
+    Instruction("RZ", "\xC8"),
+    Instruction("RET", "\xC9"),
     Instruction("JZ %s", "\xCA",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("*JMP %s", "\xCB",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("CZ %s", "\xCC",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("CALL %s", "\xCD",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("ACI %s", "\xCE",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 1", "\xCF",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RNC", "\xD0",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("POP D", "\xD1",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 1", "\xCF"),
+    Instruction("RNC", "\xD0"),
+    Instruction("POP D", "\xD1"),
     Instruction("JNC %s", "\xD2",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("OUT %s", "\xD3",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
     Instruction("CNC %s", "\xD4",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("PUSH D", "\xD5",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("PUSH D", "\xD5"),
     Instruction("SUI %s", "\xD6",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 2", "\xD7",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RC", "\xD8",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("*RET", "\xD9",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 2", "\xD7"),
+    Instruction("RC", "\xD8"),
+    Instruction("*RET", "\xD9"),
     Instruction("JC %s", "\xDA",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("IN %s", "\xDB",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
     Instruction("CC %s", "\xDC",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("*CALL %s", "\xDD",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("SBI %s", "\xDE",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 3", "\xDF",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RPO", "\xE0",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("POP H", "\xE1",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 3", "\xDF"),
+    Instruction("RPO", "\xE0"),
+    Instruction("POP H", "\xE1"),
     Instruction("JPO %s", "\xE2",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("XTHL", "\xE3",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("XTHL", "\xE3"),
     Instruction("CPO %s", "\xE4",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("PUSH H", "\xE5",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("PUSH H", "\xE5"),
     Instruction("ANI %s", "\xE6",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 4", "\xE7",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RPE", "\xE8",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("PCHL", "\xE9",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 4", "\xE7"),
+    Instruction("RPE", "\xE8"),
+    Instruction("PCHL", "\xE9"),
     Instruction("JPE %s", "\xEA",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("XCHG", "\xEB",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("XCHG", "\xEB"),
     Instruction("CPE %s", "\xEC",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("*CALL %s", "\xED",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("XRI %s", "\xEE",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 5", "\xEF",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RP", "\xF0",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("POP PSW", "\xF1",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 5", "\xEF"),
+    Instruction("RP", "\xF0"),
+    Instruction("POP PSW", "\xF1"),
     Instruction("JP %s", "\xF2",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("DI", "\xF3",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("DI", "\xF3"),
     Instruction("CP %s", "\xF4",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("PUSH PSW", "\xF5",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("PUSH PSW", "\xF5"),
     Instruction("ORI %s", "\xF6",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 6", "\xF7",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("RM", "\xF8",
-                fn=lambda env:
-                    None
-                ),
-    Instruction("SPHL", "\xF9",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 6", "\xF7"),
+    Instruction("RM", "\xF8"),
+    Instruction("SPHL", "\xF9"),
     Instruction("JM %s", "\xFA",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
-    Instruction("EI", "\xFB",
-                fn=lambda env:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
+    Instruction("EI", "\xFB"),
   Instruction("CM %s", "\xFC",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("*CALL %s", "\xFD",
-                Operand(None, "a16", 0x02),
-                fn=lambda env, a16:
-                    None
-                ),
+                Operand(None, "a16", 0x02)),
     Instruction("CPI %s", "\xFE",
-                Operand(None, "d8", 0x01),
-                fn=lambda env, d8:
-                    None
-                ),
-    Instruction("RST 7", "\xFF",
-                fn=lambda env:
-                    None
-                )
+                Operand(None, "d8", 0x01)),
+    Instruction("RST 7", "\xFF")
     ]))
 
+HANDLERS = build_handlers()
+WRITE_PROBES = build_write_probes()
+# the compiled blocks test these inline instead of calling the handler
+JUMP_CONDITIONS = {HANDLERS[0xC2 | cond << 3]: CONDITIONS[cond]
+                   for cond in range(8)}
+# the emulator's handlers are the instruction functions
+for byte_ident, instr in OPCODE_MAP.items():
+    instr.fn = HANDLERS[ord(byte_ident)]
+
+DECODE_TABLE = compile_opcode_map(OPCODE_MAP)
+
+
+def _cli_int(text):
+    return int(text, 0)
+
+
+def _cli_parser():
+    parser = argparse.ArgumentParser(
+        prog="unazed_disasm",
+        description="disassemble an 8080 binary into a listing")
+    parser.add_argument("file", nargs="?", default="-",
+                        help="binary to disassemble, '-' reads stdin")
+    parser.add_argument("--org", type=_cli_int, default=0x00,
+                        help="load address of the first byte (e.g. 0x100)")
+    parser.add_argument("--start", type=_cli_int, default=0,
+                        help="file offset to start disassembling from")
+    parser.add_argument("--length", type=_cli_int, default=None,
+                        help="number of bytes to disassemble")
+    parser.add_argument("--format", choices=CLI_FORMATS, default="listing")
+    parser.add_argument("--output", "-o", default="-",
+                        help="output path, '-' writes stdout")
+    parser.add_argument("--on-error", choices=ERROR_POLICIES, default="db",
+                        help="what to do with truncated or unknown bytes")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="decode large files over this many processes")
+    parser.add_argument("--cache-dir", default=None,
+                        help="reuse decoded records cached in this directory")
+    parser.add_argument("--symbols", action="append", default=[],
+                        metavar="PATH",
+                        help="load names from an EQU or .sym file (repeatable)")
+    parser.add_argument("--classify", action="store_true",
+                        help="write strings and address tables as DB/DW "
+                             "instead of decoding them")
+    parser.add_argument("--labels", action="store_true",
+                        help="name branch targets and the CP/M and RST "
+                             "entry points")
+    return parser
+
+
+def _cli_records(args, stack):
+    if args.file == "-":
+        stdin = sys.stdin.buffer
+        skip = args.start
+        while skip > 0 and (chunk := stdin.read(min(skip, CLI_CHUNK_SIZE))):
+            skip -= len(chunk)
+        if not args.classify:
+            decoder = StreamDecoder(org=args.org, on_error=args.on_error)
+            return decoder.renderer, decoder.iterate_file(
+                stdin, CLI_CHUNK_SIZE, args.length)
+        # classifying needs the whole image at once
+        data = stdin.read() if args.length is None \
+            else stdin.read(args.length)
+        disasm = Disassembler(data, OPCODE_MAP, args.org, args.on_error)
+    else:
+        disasm = Disassembler.from_file(args.file, org=args.org,
+                                        offset=args.start, length=args.length,
+                                        on_error=args.on_error)
+    stack.append(disasm)
+    if args.classify:
+        return disasm.renderer, _as_batch(disasm.iterate_classified())
+    if args.cache_dir is not None:
+        return disasm.renderer, DecodeCache(args.cache_dir).decode(disasm)
+    if args.workers is not None:
+        return disasm.renderer, disasm.decode_parallel(workers=args.workers)
+    if numpy is not None:
+        return disasm.renderer, disasm.decode_numpy()
+    return disasm.renderer, disasm.decode_batch()
+
+
+def _cli_symbols(args, renderer, records, stack):
+    symbols = SymbolTable()
+    for path in args.symbols:
+        symbols.load(path)
+    # a piped image is only seen once, so branch targets can't be named
+    # ahead of their first use there
+    if args.labels and stack:
+        symbols.auto_label(records, renderer.table, args.org,
+                           len(stack[0].data))
+    renderer.symbols = symbols
+
+
+def main(argv=None):
+    args = _cli_parser().parse_args(argv)
+    stack = []
+    try:
+        renderer, records = _cli_records(args, stack)
+        if args.symbols or args.labels:
+            _cli_symbols(args, renderer, records, stack)
+        binary = args.format in BINARY_FORMATS
+        if args.output == "-":
+            stdout = sys.stdout.buffer if binary else sys.stdout
+            write_records(stdout, records, renderer, args.format)
+            stdout.flush()
+        else:
+            with open(args.output, 'wb' if binary else 'w',
+                      buffering=CLI_BUFFER_SIZE) as file:
+                write_records(file, records, renderer, args.format)
+    except BrokenPipeError:
+        # the reader went away (e.g. piped into head); don't let the
+        # interpreter complain again while flushing stdout on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except DisassemblerError as exc:
+        print(f"unazed_disasm: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        for disasm in stack:
+            disasm.close()
+    return 0
 
 
+if __name__ == "__main__":
+    sys.exit(main())